@@ -1,13 +1,36 @@
+import time
+STARTUP_T0 = time.perf_counter()  # inici del procés, per a --startup-report
 import pygame
 import random
 import sys
 import os
 import math
 import string
+import argparse
+import bisect
+import json
+import hashlib
+import threading
+import atexit
+import csv
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # l'eina --beatmap el necessita; els grinch del joc de plataformes tornen a un sprite per enemic
+    np = None
 
 # --- CONFIGURACIÓ GLOBAL ---
-pygame.init()
-pygame.mixer.init() 
+# Les eines de línia d'ordres corren sense pantalla ni àudio reals (drivers "dummy" de SDL)
+BENCH_MODE = __name__ == "__main__" and "--bench" in sys.argv
+BEATMAP_MODE = __name__ == "__main__" and "--beatmap" in sys.argv
+PREPROCESS_MODE = __name__ == "__main__" and "--preprocess" in sys.argv
+REPLAY_MODE = __name__ == "__main__" and "--replay" in sys.argv
+if BENCH_MODE or BEATMAP_MODE or PREPROCESS_MODE or REPLAY_MODE:
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
 
 # Colors Generals
 WHITE = (255, 255, 255)
@@ -32,26 +55,791 @@ DARUMA_RED_FALLBACK = (220, 20, 60)
 BROWN_STICK = (101, 67, 33)
 SOUP_HIGHLIGHT = (255, 215, 0, 100)
 SOUP_FOUND = (50, 200, 50, 128)
+SOUP_HINT = (100, 180, 255, 150)
+
+# --- ARRENCADA ---
+# Importar el mòdul no toca SDL: pantalla, fonts i mixer s'inicialitzen quan es necessiten
+# i el temps de cada fase queda apuntat per a --startup-report.
+startup_times = OrderedDict()  # fase -> ms
+
+@contextmanager
+def startup_phase(name):
+    t0 = time.perf_counter()
+    try: yield
+    finally: startup_times[name] = startup_times.get(name, 0) + (time.perf_counter() - t0) * 1000
+
+def print_startup_report():
+    print("Arrencada (ms):")
+    for name, ms in startup_times.items(): print(f"  {name:<14}{ms:>9.1f}")
+    print(f"  {'total':<14}{(time.perf_counter() - STARTUP_T0) * 1000:>9.1f}")
+
+def init_pygame():
+    """Només els mòduls que calen per dibuixar; el mixer (obrir l'àudio) va a part, a init_mixer()"""
+    if not (pygame.display.get_init() and pygame.font.get_init()):
+        with startup_phase("init"):
+            pygame.display.init(); pygame.font.init()
+
+def init_mixer():
+    """Obre el dispositiu d'àudio la primera vegada que es demana; retorna si hi ha mixer"""
+    if not pygame.mixer.get_init():
+        with startup_phase("mixer"):
+            try: pygame.mixer.init()
+            except pygame.error: return False
+    return True
+
+# Resolució nom de font -> fitxer, desada a disc: SysFont escaneja totes les fonts del sistema
+# la primera vegada, i això és la part més lenta d'obrir el joc.
+FONT_CACHE_FILE = "cache_fonts.json"
+font_paths = None  # "nom|negreta" -> [ruta o None, cal negreta sintètica]
+
+def resolve_font(name, bold):
+    global font_paths
+    if font_paths is None:
+        try:
+            with open(FONT_CACHE_FILE, encoding="utf-8") as f: font_paths = json.load(f)
+        except (OSError, ValueError):
+            font_paths = {}
+    key = f"{name}|{int(bold)}"
+    entry = font_paths.get(key)
+    if entry is None or (entry[0] and not os.path.exists(entry[0])):
+        # El 'constructor' de SysFont rep la ruta triada i si cal simular la negreta
+        entry = pygame.font.SysFont(name, 1, bold, constructor=lambda path, size, fake_bold, italic: [path, fake_bold])
+        font_paths[key] = entry
+        try:
+            with open(FONT_CACHE_FILE, "w", encoding="utf-8") as f: json.dump(font_paths, f, indent=1)
+        except OSError:
+            pass
+    return entry
+
+class LazyFont:
+    """Font que no es busca ni es carrega fins al primer render; la resta d'atributs són els de pygame.font.Font"""
+    def __init__(self, name, size, bold=False, fallback_size=None):
+        self.name, self.size_px, self.bold = name, size, bold
+        self.fallback_size = fallback_size or size
+        self.font = None
+    def get(self):
+        if self.font is None:
+            with startup_phase("fonts"):
+                try:
+                    path, fake_bold = resolve_font(self.name, self.bold)
+                    self.font = pygame.font.Font(path, self.size_px)
+                    if fake_bold: self.font.set_bold(True)
+                except (OSError, pygame.error):
+                    self.font = pygame.font.Font(None, self.fallback_size)
+        return self.font
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
 
 # Configuració de Pantalla
-screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
-WIDTH, HEIGHT = screen.get_size()
-pygame.display.set_caption("JOC DE NADAL DE FAMÍLIA")
-
 clock = pygame.time.Clock()
 FPS = 60
+fps_cap = FPS  # 0 = sense límit (benchmark)
+screen = None
+WIDTH = HEIGHT = 0
 
-# --- FONTS ---
-try:
-    font_ui = pygame.font.SysFont("georgia", int(HEIGHT * 0.04), bold=True)
-    font_title = pygame.font.SysFont("georgia", int(HEIGHT * 0.10), bold=True)
-    font_big = pygame.font.SysFont("georgia", int(HEIGHT * 0.12), bold=True)
-    font_soup = pygame.font.SysFont("courier new", int(HEIGHT * 0.04), bold=True) 
-except:
-    font_ui = pygame.font.Font(None, int(HEIGHT * 0.05))
-    font_title = pygame.font.Font(None, int(HEIGHT * 0.10))
-    font_big = pygame.font.Font(None, int(HEIGHT * 0.15))
-    font_soup = pygame.font.Font(None, int(HEIGHT * 0.05))
+def init_display(size=None, fullscreen=True):
+    """
+    Crea (o recrea) la finestra i les fonts que en depenen.
+    Sense 'size' s'agafa la resolució de l'escriptori.
+    """
+    global screen, WIDTH, HEIGHT, font_ui, font_title, font_big, font_soup, font_soup_small, font_perf
+    init_pygame()
+    flags = pygame.FULLSCREEN if fullscreen else 0
+    with startup_phase("display"):
+        if pygame.display.get_surface() is not None:
+            # Alguns drivers no canvien de mida un mode FULLSCREEN ja obert
+            pygame.display.quit(); pygame.display.init()
+        screen = pygame.display.set_mode(size or (0, 0), flags)
+        WIDTH, HEIGHT = screen.get_size()
+        pygame.display.set_caption("JOC DE NADAL DE FAMÍLIA")
+
+    # --- FONTS --- (objectes nous a cada resolució: el cache de text les fa servir de clau)
+    font_ui = LazyFont("georgia", int(HEIGHT * 0.04), True, int(HEIGHT * 0.05))
+    font_title = LazyFont("georgia", int(HEIGHT * 0.10), True)
+    font_big = LazyFont("georgia", int(HEIGHT * 0.12), True, int(HEIGHT * 0.15))
+    font_soup = LazyFont("courier new", int(HEIGHT * 0.04), True, int(HEIGHT * 0.05))
+    font_soup_small = LazyFont("courier new", int(HEIGHT * 0.022), True, int(HEIGHT * 0.028))
+    font_perf = LazyFont("courier new", max(12, int(HEIGHT * 0.02)))
+    profiler.sync_screen()
+
+# --- ENTRADA I FINAL DE FRAME ---
+# Permeten que el benchmark substitueixi el teclat/ratolí reals i mesuri cada frame.
+class KeyState:
+    """Estat de tecles simulat, compatible amb el resultat de pygame.key.get_pressed()"""
+    def __init__(self, pressed=()):
+        self.pressed = set(pressed)
+    def __getitem__(self, key):
+        return key in self.pressed
+
+class ScriptedInput:
+    """Teclat i ratolí simulats; 'script(frame, inp)' es crida a cada frame per moure'ls o enviar events"""
+    def __init__(self, script):
+        self.script = script
+        self.keys = KeyState()
+        self.mouse_pos = (0, 0)
+        self.frame = 0
+    def step(self):
+        self.script(self.frame, self)
+        self.frame += 1
+    def post_key(self, key):
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0, unicode=""))
+    def post_mouse(self, ev_type, pos):
+        self.mouse_pos = pos
+        if ev_type == pygame.MOUSEMOTION: pygame.event.post(pygame.event.Event(ev_type, pos=pos, rel=(0, 0), buttons=(1, 0, 0)))
+        else: pygame.event.post(pygame.event.Event(ev_type, pos=pos, button=1))
+
+class RecordedKeys:
+    """Envolta pygame.key.get_pressed() i apunta quines de les tecles consultades estan premudes"""
+    def __init__(self, state, pressed):
+        self.state = state; self.pressed = pressed
+    def __getitem__(self, key):
+        down = self.state[key]
+        if down: self.pressed.add(key)
+        return down
+
+class InputRecorder:
+    """
+    Grava cada partida (--record FITXER): la llavor del 'random' i, per a cada frame, els ms de
+    simulació que ha fet servir (la suma dona el moment de cada event), els events d'entrada i
+    les tecles/ratolí consultats. Mentre es grava, cada frame simula la durada real del frame
+    anterior (sim_frame_ms), de manera que --replay en pot refer exactament els mateixos passos.
+    El rellotge de la cançó del joc de ritme segueix corregint-se amb l'àudio i es grava el temps
+    de cançó de cada frame, que la reproducció fa servir tal qual.
+    """
+    VERSION = 2
+    RECORDED_EVENTS = (pygame.KEYDOWN, pygame.KEYUP, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION)
+
+    def __init__(self, path):
+        self.path = path
+        self.sessions = []
+        self.current = None
+        self.frame = None  # [ms de simulació, events, tecles premudes o None, ratolí o None, ms de cançó o None]
+        self.last = 0.0
+        atexit.register(self.save)
+
+    def start(self, game_name, character_name):
+        global sim_frame_ms
+        seed = random.randrange(1 << 32); random.seed(seed)
+        self.current = {"game": game_name, "character": character_name, "seed": seed, "frames": []}
+        self.sessions.append(self.current)
+        sim_frame_ms = 0.0; self.last = None  # el rellotge comença amb el bucle, no amb la càrrega
+        self.frame = [sim_frame_ms, [], None, None, None]
+
+    def stop(self):
+        """Tanca la sessió; el següent número del 'random' permet comprovar que la reproducció no divergeix"""
+        global sim_frame_ms
+        if self.current is None: return
+        self.current["rng_check"] = random.random()
+        self.current = None; sim_frame_ms = None
+
+    def record_events(self, events):
+        if self.last is None: self.last = time.perf_counter()
+        for e in events:
+            if e.type not in self.RECORDED_EVENTS: continue
+            if e.type in (pygame.KEYDOWN, pygame.KEYUP): self.frame[1].append([e.type, e.key])
+            else: self.frame[1].append([e.type, e.pos[0], e.pos[1], getattr(e, "button", 0)])
+
+    def record_keys(self, state):
+        if self.frame[2] is None: self.frame[2] = set()
+        return RecordedKeys(state, self.frame[2])
+
+    def record_song_time(self, song_ms):
+        self.frame[4] = round(song_ms, 3)
+        return self.frame[4]
+
+    def record_mouse(self, pos):
+        self.frame[3] = list(pos)
+        return pos
+
+    def end_frame(self):
+        global sim_frame_ms
+        if self.frame[2] is not None: self.frame[2] = sorted(self.frame[2])
+        self.current["frames"].append(self.frame)
+        now = time.perf_counter()
+        sim_frame_ms = round((now - (self.last or now)) * 1000, 3); self.last = now
+        self.frame = [sim_frame_ms, [], None, None, None]
+
+    def save(self):
+        if not self.sessions: return
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "res": [WIDTH, HEIGHT], "sessions": self.sessions}, f, separators=(",", ":"))
+
+scripted_input = None  # quan no és None substitueix l'entrada real
+frame_hook = None      # es crida al final de cada frame, després del flip
+input_recorder = None  # InputRecorder si s'ha demanat --record
+
+def recording():
+    return input_recorder is not None and input_recorder.current is not None
+
+def get_keys():
+    if scripted_input: return scripted_input.keys
+    if recording(): return input_recorder.record_keys(pygame.key.get_pressed())
+    return pygame.key.get_pressed()
+
+def get_mouse_pos():
+    if scripted_input: return scripted_input.mouse_pos
+    if recording(): return input_recorder.record_mouse(pygame.mouse.get_pos())
+    return pygame.mouse.get_pos()
+
+def get_events(scene):
+    """
+    Com pygame.event.get(), però en mesura el temps i s'empassa F3 (mostra/amaga el perfilador).
+    'scene' és el nom de la pantalla que fa el bucle, per a la columna 'scene' de la traça.
+    """
+    t0 = time.perf_counter()
+    events = pygame.event.get()
+    profiler.events_ms += (time.perf_counter() - t0) * 1000
+    profiler.scene = scene
+    if any(e.type == pygame.KEYDOWN and e.key == pygame.K_F3 for e in events):
+        profiler.toggle_overlay()
+        events = [e for e in events if not (e.type == pygame.KEYDOWN and e.key == pygame.K_F3)]
+    if recording(): input_recorder.record_events(events)
+    return events
+
+def mark_draw():
+    """Marca on s'acaba l'actualització del frame i comença el dibuix"""
+    profiler.draw_at = time.perf_counter()
+
+def end_frame(rects=None):
+    """Presenta el frame (sencer, o només 'rects') i espera el següent tick del rellotge"""
+    t_present = time.perf_counter()
+    if profiler.active: rects = profiler.present(rects)
+    t_flip = time.perf_counter()
+    if rects is None: pygame.display.flip()
+    else: pygame.display.update(rects)
+    t_hook = time.perf_counter()
+    if frame_hook: frame_hook()
+    if scripted_input: scripted_input.step()
+    t_tick = time.perf_counter()
+    clock.tick(fps_cap)
+    profiler.end_frame(t_present, t_flip, t_hook, t_tick)
+    if recording(): input_recorder.end_frame()
+
+# --- PERFILADOR DE FRAMES (F3: overlay; --profile FITXER.csv|.json: traça de cada frame) ---
+class CountingScreen(pygame.Surface):
+    """Buffer intermedi que substitueix la pantalla mentre el perfilador és actiu: compta els blits que rep"""
+    def blit(self, *args, **kwargs):
+        profiler.blits += 1
+        return super().blit(*args, **kwargs)
+
+def counted(surf):
+    """Apunta al perfilador (si és actiu) una superfície que el joc acaba de crear, i la retorna"""
+    if profiler.active: profiler.allocs += 1
+    return surf
+
+class FrameProfiler:
+    """
+    Temps de cada fase del frame: events, update (fins a mark_draw()), draw, flip i espera del
+    rellotge, més els blits i les superfícies creades. Mentre està actiu es dibuixa en un buffer
+    intermedi (CountingScreen); la còpia d'aquest buffer i l'overlay van a la columna 'profiler'.
+    'blits' són només els que rep la pantalla (no els de capes intermèdies); 'allocs' són les
+    superfícies que crea el joc als llocs marcats amb counted(): constructors, image.load,
+    convert, transform, subsurface i font.render del cache de text (no les que descodifica el fil
+    de precàrrega, que no van a cap frame).
+    """
+    COLUMNS = ("frame", "scene", "events_ms", "update_ms", "draw_ms", "flip_ms", "wait_ms", "profiler_ms", "blits", "allocs")
+    OVERLAY_REFRESH_MS = 250
+
+    def __init__(self):
+        self.overlay = False
+        self.trace = None  # files de la traça, si s'ha demanat
+        self.trace_path = None
+        self.scene = ""
+        self.frame = 0
+        self.recent = deque(maxlen=60)  # últims frames, per a les mitjanes de l'overlay
+        self.overlay_surf = None; self.overlay_at = 0.0
+        self.start = time.perf_counter()
+        self.events_ms = 0.0; self.draw_at = None; self.blits = 0; self.allocs = 0
+
+    @property
+    def active(self):
+        return self.overlay or self.trace is not None
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay; self.overlay_surf = None
+        self.sync_screen()
+
+    def start_trace(self, path):
+        self.trace = []; self.trace_path = path
+        atexit.register(self.save_trace)
+        self.sync_screen()
+
+    def sync_screen(self):
+        """Posa o treu el buffer intermedi segons si el perfilador és actiu"""
+        global screen
+        display = pygame.display.get_surface()
+        if display is None: return
+        if self.active and screen is display:
+            back = CountingScreen(display.get_size(), 0, display)
+            back.blit(display, (0, 0))  # el mode --dirty-rects compta amb el contingut del frame anterior
+            screen = back
+        elif not self.active and screen is not display:
+            display.blit(screen, (0, 0)); screen = display
+
+    def overlay_rect(self):
+        if self.overlay_surf is None or (time.perf_counter() - self.overlay_at) * 1000 >= self.OVERLAY_REFRESH_MS:
+            self.overlay_surf = self.render_overlay(); self.overlay_at = time.perf_counter()
+        return self.overlay_surf.get_rect(topright=(WIDTH - 10, 10))
+
+    def render_overlay(self):
+        n = max(1, len(self.recent))
+        avg = [sum(row[i] for row in self.recent) / n for i in range(2, 10)]
+        total = sum(avg[:6])
+        lines = [f"{1000 / total if total else 0:6.1f} FPS {total:6.2f} ms",
+                 f"events {avg[0]:5.2f}  update {avg[1]:5.2f}",
+                 f"draw   {avg[2]:5.2f}  flip   {avg[3]:5.2f}",
+                 f"wait   {avg[4]:5.2f}  perf   {avg[5]:5.2f}",
+                 f"blits {avg[6]:6.0f}  allocs {avg[7]:5.1f}"]
+        # font.render directe: el cache de text no s'ha d'omplir de números que canvien sempre
+        rendered = [font_perf.render(line, True, WHITE) for line in lines]
+        surf = pygame.Surface((max(r.get_width() for r in rendered) + 16, sum(r.get_height() for r in rendered) + 12))
+        surf.fill((20, 20, 30))
+        y = 6
+        for r in rendered: surf.blit(r, (8, y)); y += r.get_height()
+        return surf
+
+    def present(self, rects):
+        """Afegeix l'overlay i copia el buffer intermedi a la pantalla; retorna les zones a enviar"""
+        if self.overlay:
+            rect = self.overlay_rect()
+            pygame.Surface.blit(screen, self.overlay_surf, rect)  # sense comptar-lo com a blit del joc
+            if rects is not None: rects = rects + [rect]
+        display = pygame.display.get_surface()
+        if rects is None: display.blit(screen, (0, 0))
+        else:
+            for r in rects: display.blit(screen, r, r)
+        return rects
+
+    def end_frame(self, t_present, t_flip, t_hook, t_tick):
+        now = time.perf_counter()
+        if self.active:
+            draw_at = self.draw_at or t_present
+            row = (self.frame, self.scene, self.events_ms,
+                   max(0.0, (draw_at - self.start) * 1000 - self.events_ms), (t_present - draw_at) * 1000,
+                   (t_hook - t_flip) * 1000, (now - t_tick) * 1000, (t_flip - t_present) * 1000,
+                   self.blits, self.allocs)
+            self.recent.append(row)
+            if self.trace is not None: self.trace.append(row)
+        self.frame += 1
+        self.start = now; self.events_ms = 0.0; self.draw_at = None; self.blits = 0; self.allocs = 0
+
+    def save_trace(self, path=None):
+        path = path or self.trace_path
+        if not path or not self.trace: return
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump([dict(zip(self.COLUMNS, row)) for row in self.trace], f, indent=1)
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f); writer.writerow(self.COLUMNS)
+                writer.writerows((*row[:2], *(round(v, 3) for v in row[2:8]), *row[8:]) for row in self.trace)
+
+profiler = FrameProfiler()
+
+# --- SIMULACIÓ A PAS FIX ---
+SIM_HZ = 60
+SIM_DT = 1000 / SIM_HZ  # ms per pas de simulació
+MAX_SIM_STEPS = 5       # si el render no dona l'abast es descarta temps, en lloc d'entrar en espiral
+sim_frame_ms = None     # si no és None, cada frame avança exactament aquests ms (benchmark)
+song_time_override = None  # si no és None, temps de cançó d'aquest frame (reproducció de --replay)
+
+class FixedStep:
+    """Acumula el temps real i diu quants passos de simulació de SIM_DT toca fer cada frame"""
+    def __init__(self):
+        self.accum = 0.0
+        self.last = time.perf_counter()
+
+    def advance(self):
+        now = time.perf_counter()
+        elapsed = sim_frame_ms if sim_frame_ms is not None else (now - self.last) * 1000
+        self.last = now
+        self.accum += elapsed
+        steps = int(self.accum // SIM_DT)
+        if steps > MAX_SIM_STEPS: steps = MAX_SIM_STEPS; self.accum = 0.0
+        else: self.accum -= steps * SIM_DT
+        return steps
+
+    @property
+    def alpha(self):
+        """Fracció del pas següent ja transcorreguda, per interpolar el dibuix"""
+        return self.accum / SIM_DT
+
+def save_prev_pos(sprites):
+    for sprite in sprites: sprite.prev_pos = sprite.rect.topleft
+
+def interp_pos(sprite, alpha):
+    """Posició de dibuix interpolada entre el pas de simulació anterior i l'actual"""
+    px, py = getattr(sprite, "prev_pos", sprite.rect.topleft)
+    return (px + (sprite.rect.x - px) * alpha, py + (sprite.rect.y - py) * alpha)
+
+# --- RENDERITZAT PER ZONES BRUTES (opcional: --dirty-rects) ---
+dirty_rects_mode = False
+
+class DirtyRects:
+    """
+    Cada frame, els elements que poden canviar es registren amb el seu rect i un 'estat'.
+    Només es repinten i s'envien a la pantalla les zones on el rect o l'estat ha canviat.
+    """
+    def __init__(self):
+        self.prev = {}
+        self.curr = {}
+        self.full = True
+        self.size = None
+
+    def track(self, key, rect, state=None):
+        self.curr[key] = (pygame.Rect(rect) if rect else None, state)
+
+    def invalidate(self):
+        """Força repintar tota la pantalla al proper frame (p.ex. en tornar d'un joc)"""
+        self.full = True
+
+    def collect(self):
+        """Zones a repintar aquest frame, o None si cal repintar-ho tot"""
+        if screen.get_size() != self.size: self.full = True; self.size = screen.get_size()
+        rects = []
+        if not self.full:
+            for key in self.prev.keys() | self.curr.keys():
+                before = self.prev.get(key); now = self.curr.get(key)
+                if before == now: continue
+                for entry in (before, now):
+                    if entry and entry[0]: rects.append(entry[0].clip(screen.get_rect()))
+        self.prev = self.curr; self.curr = {}
+        if self.full: self.full = False; return None
+        return merge_rects([r for r in rects if r.width and r.height])
+
+def merge_rects(rects):
+    """Fusiona els rects que se solapen perquè no es repinti dues vegades la mateixa zona"""
+    merged = []
+    for r in rects:
+        r = r.copy()
+        i = 0
+        while i < len(merged):
+            if merged[i].colliderect(r): r.union_ip(merged.pop(i)); i = 0
+            else: i += 1
+        merged.append(r)
+    return merged
+
+def render_scene(dirty, draw):
+    """Crida 'draw' per pintar l'escena: sencera, o retallada a cada zona bruta si 'dirty' no és None"""
+    mark_draw()
+    # L'overlay del perfilador es redibuixa cada frame: la zona de sota també s'ha de repintar
+    if dirty and profiler.overlay: dirty.track("profiler", profiler.overlay_rect(), profiler.frame)
+    rects = dirty.collect() if dirty else None
+    if rects is None:
+        draw(); end_frame(); return
+    for r in rects:
+        screen.set_clip(r); draw()
+    screen.set_clip(None)
+    end_frame(rects)
+
+# --- CACHE D'IMATGES ---
+ASSET_CACHE_BYTES = 192 * 1024 * 1024
+
+class AssetCache:
+    """
+    Cache LRU de superfícies ja carregades i escalades.
+    La clau és (ruta, mida, flip, alpha) i el límit es compta en bytes de píxels.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.on_evict = None  # es crida amb (clau, superfície) per cada entrada expulsada
+
+    def get(self, key, loader):
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surf
+        self.misses += 1
+        return self.put(key, loader())
+
+    def put(self, key, surf):
+        self.entries[key] = surf
+        self.used_bytes += surf.get_pitch() * surf.get_height()
+        self.evict()
+        return surf
+
+    def touch(self, key):
+        """Compta un encert i marca 'key' com a usada recentment (si encara hi és)"""
+        if key not in self.entries: return False
+        self.entries.move_to_end(key); self.hits += 1
+        return True
+
+    def discard(self, key):
+        surf = self.entries.pop(key, None)
+        if surf is not None: self.used_bytes -= surf.get_pitch() * surf.get_height()
+
+    def evict(self):
+        # Sempre conservem l'entrada més recent, encara que superi el límit tota sola
+        while self.used_bytes > self.max_bytes and len(self.entries) > 1:
+            key, old = self.entries.popitem(last=False)
+            self.used_bytes -= old.get_pitch() * old.get_height()
+            if self.on_evict: self.on_evict(key, old)
+
+    def clear(self):
+        self.entries.clear(); self.used_bytes = 0
+
+asset_cache = AssetCache(ASSET_CACHE_BYTES)
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""): h.update(block)
+    return h.hexdigest()
+
+# --- IMATGES PRE-ESCALADES (python videojoc_nadal.py --preprocess --res WxH) ---
+PREPROCESSED_DIR = "cache_imatges"
+PREPROCESSED_VERSION = 1
+use_preprocessed = True
+asset_requests = None  # quan és un set, load_image hi apunta cada petició (per al preprocés)
+preprocessed = {"res": None, "entries": {}}
+
+def preprocessed_dir(res):
+    return os.path.join(PREPROCESSED_DIR, f"{res[0]}x{res[1]}")
+
+def asset_key_name(path, size, flip, alpha):
+    return f"{path}|{size}|{int(flip)}|{int(alpha)}"
+
+def preprocessed_entries():
+    """Manifest de les imatges pre-escalades per a la resolució actual (es llegeix un cop)"""
+    if preprocessed["res"] != (WIDTH, HEIGHT):
+        preprocessed["res"] = (WIDTH, HEIGHT); preprocessed["entries"] = {}
+        try:
+            with open(os.path.join(preprocessed_dir((WIDTH, HEIGHT)), "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == PREPROCESSED_VERSION: preprocessed["entries"] = manifest["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+    return preprocessed["entries"]
+
+def source_matches(path, entry):
+    """Comprova que el fitxer original no ha canviat des del preprocés"""
+    try: st = os.stat(path)
+    except OSError: return False
+    if st.st_size != entry["source_size"]: return False
+    if st.st_mtime_ns == entry["source_mtime_ns"]: return True
+    return file_hash(path) == entry["source_sha1"]
+
+def read_preprocessed(path, size, flip, alpha):
+    """Imatge pre-escalada i vigent per a aquesta petició, sense convertir al format de pantalla, o None"""
+    if not use_preprocessed: return None
+    entry = preprocessed_entries().get(asset_key_name(path, size, flip, alpha))
+    if entry is None or not source_matches(path, entry): return None
+    try:
+        with open(os.path.join(preprocessed_dir((WIDTH, HEIGHT)), entry["file"]), "rb") as f:
+            return pygame.image.frombytes(f.read(), tuple(entry["size"]), "RGBA")
+    except (OSError, ValueError):
+        return None
+
+def load_preprocessed(path, size, flip, alpha):
+    img = read_preprocessed(path, size, flip, alpha)
+    if img is None: return None
+    return counted(img.convert_alpha() if alpha else img.convert())
+
+# --- ATLES DE TEXTURES (cares i sprites petits) ---
+ATLAS_PAGE_SIZE = 2048
+ATLAS_MAX_ITEM = 512
+ATLAS_SPRITES = {"regal.png", "grinch.png", "bola_nadal.png", "daruma.png", "tori.png"}
+
+class TextureAtlas:
+    """
+    Empaqueta imatges petites en poques pàgines grans (per prestatges) i en retorna
+    subsuperfícies, de manera que moltes imatges comparteixen la mateixa superfície.
+    Les pàgines es compten dins el límit de bytes d'asset_cache: si n'expulsa una, se'n perden
+    les entrades (es tornaran a carregar). Un canvi de resolució buida l'atles.
+    """
+    def __init__(self, page_size, cache, padding=1):
+        self.page_size = page_size
+        self.cache = cache
+        self.padding = padding
+        self.pages = []    # superfícies (None si la cache l'ha expulsada)
+        self.shelves = []  # per pàgina: llista de [y, alçada, x_lliure] (None si expulsada)
+        self.entries = {}  # clau -> (pàgina, rect, subsuperfície)
+        self.res = None
+        self.generation = 0  # distingeix les claus de pàgina d'abans i després de buidar l'atles
+        cache.on_evict = self.evicted
+
+    def page_key(self, page_index):
+        return ("atles", self.generation, page_index)
+
+    def sync_res(self):
+        if self.res == (WIDTH, HEIGHT): return
+        for page_index in range(len(self.pages)): self.cache.discard(self.page_key(page_index))
+        self.pages.clear(); self.shelves.clear(); self.entries.clear()
+        self.res = (WIDTH, HEIGHT); self.generation += 1
+
+    def has(self, key):
+        self.sync_res()
+        return key in self.entries
+
+    def get(self, key):
+        self.sync_res()
+        entry = self.entries.get(key)
+        if entry is None: return None
+        self.cache.touch(self.page_key(entry[0]))
+        return entry[2]
+
+    def add(self, key, surf):
+        self.sync_res()
+        w, h = surf.get_size()
+        page_index, pos = self.place(w + self.padding, h + self.padding)
+        rect = pygame.Rect(pos, (w, h))
+        # Còpia exacta de píxels i alfa: la pàgina és transparent (0,0,0,0) i ADD no barreja
+        self.pages[page_index].blit(surf, rect, special_flags=pygame.BLEND_RGBA_ADD)
+        sub = counted(self.pages[page_index].subsurface(rect))
+        self.entries[key] = (page_index, rect, sub)
+        return sub
+
+    def evicted(self, key, page):
+        if key[:2] != ("atles", self.generation): return
+        page_index = key[2]
+        self.pages[page_index] = None; self.shelves[page_index] = None
+        for k in [k for k, entry in self.entries.items() if entry[0] == page_index]: del self.entries[k]
+
+    def place(self, w, h):
+        for page_index, shelves in enumerate(self.shelves):
+            if shelves is None: continue
+            pos = self.place_in_page(shelves, w, h)
+            if pos: return page_index, pos
+        page = counted(counted(pygame.Surface((self.page_size, self.page_size), pygame.SRCALPHA)).convert_alpha())
+        page.fill((0, 0, 0, 0))
+        self.pages.append(page); self.shelves.append([])
+        self.cache.put(self.page_key(len(self.pages) - 1), page)
+        return len(self.pages) - 1, self.place_in_page(self.shelves[-1], w, h)
+
+    def place_in_page(self, shelves, w, h):
+        best = None
+        for shelf in shelves:
+            if shelf[1] >= h and shelf[2] + w <= self.page_size and (best is None or shelf[1] < best[1]): best = shelf
+        if best is None:
+            y = shelves[-1][0] + shelves[-1][1] if shelves else 0
+            if y + h > self.page_size: return None
+            best = [y, h, 0]; shelves.append(best)
+        pos = (best[2], best[0]); best[2] += w
+        return pos
+
+    def fits(self, surf):
+        return max(surf.get_size()) <= ATLAS_MAX_ITEM
+
+texture_atlas = TextureAtlas(ATLAS_PAGE_SIZE, asset_cache)
+
+def uses_atlas(path, alpha):
+    name = os.path.basename(path)
+    return alpha and (name.startswith("cara_") or name in ATLAS_SPRITES)
+
+def scaled_size(img, size):
+    """Mida final per a 'size' de load_image(): (w, h), o una alçada mantenint proporcions"""
+    if isinstance(size, tuple): return size
+    h = int(size)
+    return int(h * (img.get_width() / img.get_height())), h
+
+def load_image(path, size=None, flip=False, alpha=True):
+    """
+    Retorna una imatge des de la cache, carregant-la i escalant-la si cal.
+    'size' pot ser (w, h), una alçada (int) mantenint proporcions, o None.
+    Si hi ha una versió pre-escalada vigent per a la resolució actual, es fa servir aquella.
+    Llença pygame.error / FileNotFoundError si el fitxer no es pot carregar.
+    """
+    if asset_requests is not None: asset_requests.add((path, size, flip, alpha))
+
+    def load_source():
+        raw = counted(pygame.image.load(path))
+        return counted(raw.convert_alpha() if alpha else raw.convert())
+
+    def load_scaled():
+        img = load_preprocessed(path, size, flip, alpha)
+        if img is not None: return img
+        img = asset_cache.get((path, None, False, alpha), load_source)
+        if size is not None: img = counted(pygame.transform.smoothscale(img, scaled_size(img, size)))
+        if flip: img = counted(pygame.transform.flip(img, True, False))
+        return img
+
+    if size is None and not flip: return asset_cache.get((path, None, False, alpha), load_source)
+    key = (path, size, flip, alpha)
+    if uses_atlas(path, alpha):
+        img = texture_atlas.get(key)
+        if img is not None: return img
+        # Les que no caben a l'atles (p.ex. a 4K) es queden soles a asset_cache
+        if key in asset_cache.entries: return asset_cache.get(key, load_scaled)
+        asset_cache.misses += 1
+        return cache_image(key, load_scaled())
+    return asset_cache.get(key, load_scaled)
+
+def cache_image(key, img):
+    """Desa una imatge ja en format de pantalla (que encara no hi és) allà on la buscarà load_image()"""
+    path, size, flip, alpha = key
+    if (size is not None or flip) and uses_atlas(path, alpha) and texture_atlas.fits(img):
+        return texture_atlas.add(key, img)
+    return asset_cache.put(key, img)
+
+def is_cached(key):
+    return key in asset_cache.entries or texture_atlas.has(key)
+
+# --- PRECÀRREGA EN SEGON PLA ---
+PRELOAD_BUDGET_MS = 4  # temps màxim per frame de menú dedicat a convertir imatges ja descodificades
+
+class AssetPreloader:
+    """
+    Fil de fons que descodifica i escala les imatges dels jocs mentre els menús estan aturats.
+    El fil només crea superfícies 'crues'; la conversió al format de pantalla (que necessita
+    la pantalla) es fa al fil principal, a pump(), i el resultat va a la cache de load_image().
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = deque()  # peticions (path, size, flip, alpha) per descodificar
+        self.ready = deque()    # (petició, superfície crua)
+        self.queued = set()
+        self.thread = None
+
+    def request(self, requests):
+        preprocessed_entries()  # el manifest es llegeix aquí, no des del fil
+        with self.lock:
+            for req in requests:
+                if req in self.queued or is_cached(req) or not os.path.exists(req[0]): continue
+                self.queued.add(req); self.pending.append(req)
+            if self.pending and self.thread is None:
+                self.thread = threading.Thread(target=self.work, name="precarrega", daemon=True)
+                self.thread.start()
+
+    def work(self):
+        sources = {}  # originals descodificats durant aquesta tanda
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        self.thread = None
+                        return
+                    req = self.pending.popleft()
+                path, size, flip, alpha = req
+                try:
+                    img = read_preprocessed(*req)
+                    if img is None:
+                        img = sources.get(path)
+                        if img is None: img = sources[path] = pygame.image.load(path)
+                        if size is not None: img = pygame.transform.smoothscale(img, scaled_size(img, size))
+                        if flip: img = pygame.transform.flip(img, True, False)
+                except (pygame.error, OSError, ValueError):
+                    continue  # el joc ja la carregarà (o en farà el substitut) pel seu compte
+                self.ready.append((req, img))
+        finally:
+            # Si el fil mor per una altra excepció (p.ex. MemoryError), request() n'ha de poder engegar un de nou
+            with self.lock:
+                if self.thread is threading.current_thread(): self.thread = None
+
+    def pump(self, budget_ms=PRELOAD_BUDGET_MS):
+        """Converteix imatges ja descodificades fins a esgotar 'budget_ms' (None = totes les llestes)"""
+        start = time.perf_counter()
+        while self.ready:
+            req, img = self.ready.popleft()
+            self.queued.discard(req)
+            if not is_cached(req): cache_image(req, counted(img.convert_alpha() if req[3] else img.convert()))
+            if budget_ms is not None and (time.perf_counter() - start) * 1000 >= budget_ms: break
+
+asset_preloader = AssetPreloader()
 
 # --- FUNCIONS AUXILIARS ---
 
@@ -92,28 +880,77 @@ def draw_paper_box(surface, rect, text_surf=None, image_surf=None, is_hovered=Fa
 def render_multiline_text(text, font, color):
     """Converteix un string amb \n en una llista de superfícies"""
     lines = text.split('\n')
-    return [font.render(line, True, color) for line in lines]
+    return [render_text(font, line, True, color) for line in lines]
+
+# --- CACHE DE TEXTOS ---
+TEXT_CACHE_SIZE = 512
+text_cache = OrderedDict()
+
+def render_text(font, text, antialias, color):
+    """Com font.render(), però reutilitza la superfície si el text ja s'ha pintat abans"""
+    key = (font, text, color, antialias)
+    surf = text_cache.get(key)
+    if surf is None:
+        surf = counted(font.render(text, antialias, color))
+        text_cache[key] = surf
+        if len(text_cache) > TEXT_CACHE_SIZE: text_cache.popitem(last=False)
+    else:
+        text_cache.move_to_end(key)
+    return surf
+
+# Capes de fons estàtiques ja compostes, vàlides per a una resolució concreta
+static_layers = {}
+static_layers_res = None
+
+def get_static_layer(key, build, variant=None):
+    """
+    Retorna la capa 'key' ja composta; només es reconstrueix si canvia la resolució o 'variant'
+    (p.ex. el personatge del hub), de manera que cada clau ocupa una sola capa de pantalla completa.
+    """
+    global static_layers_res
+    if static_layers_res != (WIDTH, HEIGHT):
+        static_layers.clear(); static_layers_res = (WIDTH, HEIGHT)
+    entry = static_layers.get(key)
+    if entry is None or entry[0] != variant:
+        static_layers.pop(key, None)  # l'anterior s'allibera abans de compondre la nova
+        entry = static_layers[key] = (variant, counted(build().convert()))
+    return entry[1]
+
+# Superfícies translúcides compartides (enfosquiments, franges, ressaltats), una per mida i color:
+# els bucles de dibuix les reutilitzen en lloc de crear-ne una de nova cada frame
+translucent_pool = {}
+translucent_pool_res = None
+
+def translucent(size, color, shape="rect"):
+    """Superfície SRCALPHA de mida 'size' plena de 'color' (o amb un cercle inscrit, shape="circle")"""
+    global translucent_pool_res
+    if translucent_pool_res != (WIDTH, HEIGHT):
+        translucent_pool.clear(); translucent_pool_res = (WIDTH, HEIGHT)
+    key = (tuple(size), color, shape)
+    surf = translucent_pool.get(key)
+    if surf is None:
+        surf = counted(pygame.Surface(key[0], pygame.SRCALPHA))
+        if shape == "circle":
+            w, h = key[0]; pygame.draw.circle(surf, color, (w // 2, h // 2), min(w, h) // 2)
+        else: surf.fill(color)
+        translucent_pool[key] = surf
+    return surf
 
 def load_face(char_name, size):
     """Càrrega i escala la cara del personatge"""
     try:
-        img = pygame.image.load(f"cara_{char_name}.png").convert_alpha()
-        orig_rect = img.get_rect()
-        aspect = orig_rect.width / orig_rect.height
-        w = int(size * aspect)
-        return pygame.transform.smoothscale(img, (w, size))
+        return load_image(f"cara_{char_name}.png", size)
     except:
-        s = pygame.Surface((size, size))
+        s = counted(pygame.Surface((size, size)))
         s.fill((0, 0, 200))
         return s
 
 def load_christmas_ball(size):
     """Càrrega la imatge de la bola de nadal pel joc de ritme"""
     try:
-        img = pygame.image.load("bola_nadal.png").convert_alpha()
-        return pygame.transform.smoothscale(img, (size, size))
+        return load_image("bola_nadal.png", (size, size))
     except:
-        s = pygame.Surface((size, size), pygame.SRCALPHA)
+        s = counted(pygame.Surface((size, size), pygame.SRCALPHA))
         pygame.draw.circle(s, CHRISTMAS_RED, (size//2, size//2), size//2)
         pygame.draw.circle(s, GOLD, (size//2, size//2), size//2, 3) 
         pygame.draw.circle(s, WHITE, (size//3, size//3), size//6)
@@ -129,7 +966,7 @@ def run_japan_game(character_name):
     GROUND_Y = HEIGHT - GROUND_HEIGHT
     bg_img = None
     if os.path.exists("fondo_fuji.png"):
-        bg_img = pygame.transform.smoothscale(pygame.image.load("fondo_fuji.png").convert(), (WIDTH, HEIGHT))
+        bg_img = load_image("fondo_fuji.png", (WIDTH, HEIGHT), alpha=False)
 
     class RunnerPlayer(pygame.sprite.Sprite):
         def __init__(self):
@@ -138,72 +975,113 @@ def run_japan_game(character_name):
             self.image = load_face(character_name, self.target_h)
             self.rect = self.image.get_rect()
             self.rect.inflate_ip(-self.rect.width*0.1, -self.rect.height*0.1)
+            self.gravity = HEIGHT * 0.0018; self.jump_force = -HEIGHT * 0.038
+            self.reset()
+        def reset(self):
             self.rect.x = WIDTH * 0.1
             self.rect.bottom = GROUND_Y
-            self.vel_y = 0; self.jumping = False; self.gravity = HEIGHT * 0.0018; self.jump_force = -HEIGHT * 0.038
+            self.prev_pos = self.rect.topleft
+            self.vel_y = 0; self.jumping = False
         def update(self):
             self.vel_y += self.gravity; self.rect.y += self.vel_y
             if self.rect.bottom >= GROUND_Y: self.rect.bottom = GROUND_Y; self.jumping = False
         def jump(self):
             if not self.jumping: self.vel_y = self.jump_force; self.jumping = True
 
+    def build_obstacle_proto(o_type):
+        """Imatge i màscara d'un tipus d'obstacle, calculades un cop per partida"""
+        if o_type == "Tori": ratio = 0.45; name = "tori.png"; color = TORI_RED_FALLBACK
+        else: ratio = 0.19; name = "daruma.png"; color = DARUMA_RED_FALLBACK
+        h = int(HEIGHT * ratio)
+        try:
+            image = load_image(name, h)
+        except:
+            image = counted(pygame.Surface((int(h*0.6), h))); image.fill(color)
+        mask = pygame.mask.from_surface(image)
+        if o_type == "Tori":
+            # Només la franja superior del Tori és sòlida
+            col_surf = counted(pygame.Surface(image.get_size(), pygame.SRCALPHA))
+            top_h = int(h * 0.25)
+            col_surf.blit(image, (0,0), (0,0, image.get_width(), top_h))
+            mask = pygame.mask.from_surface(col_surf)
+        return image, mask
+
+    obstacle_protos = {o_type: build_obstacle_proto(o_type) for o_type in ("Tori", "Daruma")}
+    obstacle_pool = []
+
     class Obstacle(pygame.sprite.Sprite):
         def __init__(self, o_type):
             super().__init__()
-            if o_type == "Tori": ratio = 0.45; name = "tori.png"; color = TORI_RED_FALLBACK
-            else: ratio = 0.19; name = "daruma.png"; color = DARUMA_RED_FALLBACK
-            h = int(HEIGHT * ratio)
-            try:
-                img = pygame.image.load(name).convert_alpha()
-                w = int(h * (img.get_width()/img.get_height()))
-                self.image = pygame.transform.smoothscale(img, (w, h))
-            except:
-                self.image = pygame.Surface((int(h*0.6), h)); self.image.fill(color)
+            self.reset(o_type)
+        def reset(self, o_type):
+            self.image, self.mask = obstacle_protos[o_type]
             self.rect = self.image.get_rect()
             offset = int(HEIGHT * 0.015); self.rect.bottom = GROUND_Y + offset
             self.rect.x = WIDTH + random.randint(0, int(WIDTH*0.3)); self.speed = WIDTH * 0.013
-            self.mask = pygame.mask.from_surface(self.image)
-            if o_type == "Tori":
-                col_surf = pygame.Surface(self.image.get_size(), pygame.SRCALPHA)
-                top_h = int(h * 0.25)
-                col_surf.blit(self.image, (0,0), (0,0, self.rect.width, top_h))
-                self.mask = pygame.mask.from_surface(col_surf)
+            self.prev_pos = self.rect.topleft
+            return self
         def update(self):
             self.rect.x -= self.speed
-            if self.rect.right < 0: self.kill()
+            if self.rect.right < 0: self.kill(); obstacle_pool.append(self)
 
-    all_sprites = pygame.sprite.Group(); obstacles = pygame.sprite.Group(); player = RunnerPlayer(); all_sprites.add(player)
-    score = 0; target = 3000; game_over = False; won = False
-    OBS_EVENT = pygame.USEREVENT + 1; pygame.time.set_timer(OBS_EVENT, 1400)
+    def spawn_obstacle(o_type):
+        """Reutilitza un obstacle mort si n'hi ha, en lloc de crear-ne un de nou"""
+        return obstacle_pool.pop().reset(o_type) if obstacle_pool else Obstacle(o_type)
+
+    class JapanSession:
+        """Estat d'una partida; reset() la torna a començar amb les mateixes imatges, màscares i sprites"""
+        def __init__(self):
+            self.player = RunnerPlayer()
+            self.all_sprites = pygame.sprite.Group(self.player); self.obstacles = pygame.sprite.Group()
+            self.target = 3000
+            self.reset()
+        def reset(self):
+            obstacle_pool.extend(self.obstacles); self.obstacles.empty()
+            self.player.reset()
+            self.score = 0; self.game_over = False; self.won = False
+            self.obs_timer = 0.0  # ms de simulació des de l'últim obstacle
+            self.ticker = FixedStep()
+        @property
+        def finished(self):
+            return self.game_over or self.won
+
+    OBS_INTERVAL = 1400  # ms de simulació entre obstacles
+    game = JapanSession(); player = game.player; obstacles = game.obstacles
     
     while True:
-        for event in pygame.event.get():
+        for event in get_events("japan"):
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE: return
                 if event.key == pygame.K_SPACE:
-                    if not game_over and not won: player.jump()
-                    elif game_over or won: return run_japan_game(character_name)
-            if event.type == OBS_EVENT and not game_over and not won: obstacles.add(Obstacle(random.choice(["Tori", "Daruma"])))
-
-        if not game_over and not won:
+                    if not game.finished: player.jump()
+                    else: game.reset()
+
+        for _ in range(game.ticker.advance()):
+            if game.finished: break
+            save_prev_pos(game.all_sprites); save_prev_pos(obstacles)
+            game.obs_timer += SIM_DT
+            if game.obs_timer >= OBS_INTERVAL: game.obs_timer -= OBS_INTERVAL; obstacles.add(spawn_obstacle(random.choice(["Tori", "Daruma"])))
             obstacles.update(); player.update()
-            if pygame.sprite.spritecollide(player, obstacles, False, pygame.sprite.collide_mask): game_over = True
-            score += 1; 
-            if score >= target: won = True
+            if pygame.sprite.spritecollide(player, obstacles, False, pygame.sprite.collide_mask): game.game_over = True
+            game.score += 1; 
+            if game.score >= game.target: game.won = True
+        alpha = 1 if game.finished else game.ticker.alpha
         
+        mark_draw()
         if bg_img: screen.blit(bg_img, (0,0))
         else: screen.fill((135, 206, 235))
         pygame.draw.rect(screen, GROUND_COLOR_JAPAN, (0, GROUND_Y, WIDTH, GROUND_HEIGHT))
-        obstacles.draw(screen); screen.blit(player.image, player.rect)
-        draw_paper_box(screen, pygame.Rect(20, 20, 300, 60), font_ui.render(f"Punts: {score}", True, TEXT_COLOR))
+        for obstacle in obstacles: screen.blit(obstacle.image, interp_pos(obstacle, alpha))
+        screen.blit(player.image, interp_pos(player, alpha))
+        draw_paper_box(screen, pygame.Rect(20, 20, 300, 60), render_text(font_ui, f"Punts: {game.score}", True, TEXT_COLOR))
 
-        if game_over or won:
-            s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); s.fill((0,0,0,180)); screen.blit(s, (0,0))
-            msg = "HAS XOCAT!" if game_over else "NIVELL SUPERAT!"; col = PAPER_COLOR if game_over else (255, 215, 0)
-            txt = font_big.render(msg, True, col); screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT//2)))
-            sub = font_ui.render("Espai: Reiniciar  |  ESC: Menú", True, WHITE); screen.blit(sub, sub.get_rect(center=(WIDTH//2, HEIGHT//2 + 80)))
-        pygame.display.flip(); clock.tick(FPS)
+        if game.finished:
+            screen.blit(translucent((WIDTH, HEIGHT), (0,0,0,180)), (0,0))
+            msg = "HAS XOCAT!" if game.game_over else "NIVELL SUPERAT!"; col = PAPER_COLOR if game.game_over else (255, 215, 0)
+            txt = render_text(font_big, msg, True, col); screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT//2)))
+            sub = render_text(font_ui, "Espai: Reiniciar  |  ESC: Menú", True, WHITE); screen.blit(sub, sub.get_rect(center=(WIDTH//2, HEIGHT//2 + 80)))
+        end_frame()
 
 # ==============================================================================
 # JOC 2: EL CAGA TIÓ (FPS)
@@ -211,200 +1089,447 @@ def run_japan_game(character_name):
 
 def run_tio_game(character_name):
     bg_img = None
-    if os.path.exists("fons_tio.png"): bg_img = pygame.transform.smoothscale(pygame.image.load("fons_tio.png").convert(), (WIDTH, HEIGHT))
+    if os.path.exists("fons_tio.png"): bg_img = load_image("fons_tio.png", (WIDTH, HEIGHT), alpha=False)
     
     tio_img = None; tio_cop_img = None
-    if os.path.exists("tio.png"):
-        raw = pygame.image.load("tio.png").convert_alpha(); scale = HEIGHT * 0.35; w = int(scale * (raw.get_width() / raw.get_height()))
-        tio_img = pygame.transform.flip(pygame.transform.smoothscale(raw, (w, int(scale))), True, False)
-    else: tio_img = pygame.Surface((200,100)); tio_img.fill((139,69,19))
+    scale = int(HEIGHT * 0.35)
+    if os.path.exists("tio.png"): tio_img = load_image("tio.png", scale, flip=True)
+    else: tio_img = counted(pygame.Surface((200,100))); tio_img.fill((139,69,19))
     
-    if os.path.exists("tio_cop.png"):
-        raw = pygame.image.load("tio_cop.png").convert_alpha(); tio_cop_img = pygame.transform.flip(pygame.transform.smoothscale(raw, (w, int(scale))), True, False)
+    if os.path.exists("tio_cop.png"): tio_cop_img = load_image("tio_cop.png", (tio_img.get_width(), scale), flip=True)
     else: tio_cop_img = tio_img
 
     stick_img = None; target_stick_len = int(HEIGHT * 0.9); target_stick_w = 60 
-    if os.path.exists("pal.png"): stick_img = pygame.transform.smoothscale(pygame.image.load("pal.png").convert_alpha(), (target_stick_w, target_stick_len))
-    else: stick_img = pygame.Surface((target_stick_w, target_stick_len), pygame.SRCALPHA); stick_img.fill(BROWN_STICK)
+    if os.path.exists("pal.png"): stick_img = load_image("pal.png", (target_stick_w, target_stick_len))
+    else: stick_img = counted(pygame.Surface((target_stick_w, target_stick_len), pygame.SRCALPHA)); stick_img.fill(BROWN_STICK)
         
     player_mini_img = load_face(character_name, 80)
-    hits_needed = 8; hits_current = 0; state = "WAITING"
-    timer_next_prompt = pygame.time.get_ticks() + random.randint(2000, 4000); timer_reaction_limit = 0; REACTION_TIME = 900
-    stick_rotation = 0; is_hitting_anim = False
+    hits_needed = 8; REACTION_TIME = 900
+
+    class TioSession:
+        """Estat d'una partida; reset() la torna a començar amb les mateixes imatges"""
+        def __init__(self):
+            self.reset()
+        def reset(self):
+            self.hits_current = 0; self.state = "WAITING"
+            self.current_time = 0.0  # temps de simulació (ms)
+            self.timer_next_prompt = self.current_time + random.randint(2000, 4000); self.timer_reaction_limit = 0
+            self.stick_rotation = 0; self.prev_stick_rotation = 0; self.is_hitting_anim = False
+            self.ticker = FixedStep()
+        def step(self):
+            self.current_time += SIM_DT; self.prev_stick_rotation = self.stick_rotation
+            if self.state == "WAITING":
+                if self.current_time >= self.timer_next_prompt: self.state = "PROMPT"; self.timer_reaction_limit = self.current_time + REACTION_TIME
+            elif self.state == "PROMPT":
+                if self.current_time > self.timer_reaction_limit: self.state = "MISS"; self.timer_next_prompt = self.current_time + 2000
+            elif self.state == "HIT_ANIM":
+                if self.stick_rotation > 0: self.stick_rotation -= 5 
+                else: self.stick_rotation = 0; self.is_hitting_anim = False; self.state = "WAITING"; self.timer_next_prompt = self.current_time + random.randint(1500, 3500)
+                if self.hits_current >= hits_needed: self.state = "WIN"
+            elif self.state == "MISS":
+                 if self.current_time >= self.timer_next_prompt: self.state = "WAITING"; self.timer_next_prompt = self.current_time + random.randint(2000, 4000)
+        def hit(self):
+            self.hits_current += 1; self.state = "HIT_ANIM"; self.is_hitting_anim = True; self.stick_rotation = self.prev_stick_rotation = 60
+
+    game = TioSession()
+    dirty = DirtyRects() if dirty_rects_mode else None
     
     while True:
-        current_time = pygame.time.get_ticks()
-        if state == "WAITING":
-            if current_time >= timer_next_prompt: state = "PROMPT"; timer_reaction_limit = current_time + REACTION_TIME
-        elif state == "PROMPT":
-            if current_time > timer_reaction_limit: state = "MISS"; timer_next_prompt = current_time + 2000
-        elif state == "HIT_ANIM":
-            if stick_rotation > 0: stick_rotation -= 5 
-            else: stick_rotation = 0; is_hitting_anim = False; state = "WAITING"; timer_next_prompt = current_time + random.randint(1500, 3500)
-            if hits_current >= hits_needed: state = "WIN"
-        elif state == "MISS":
-             if current_time >= timer_next_prompt: state = "WAITING"; timer_next_prompt = current_time + random.randint(2000, 4000)
-
-        for event in pygame.event.get():
+        for _ in range(game.ticker.advance()): game.step()
+
+        for event in get_events("tio"):
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE: return
                 if event.key == pygame.K_SPACE:
-                    if state == "PROMPT": hits_current += 1; state = "HIT_ANIM"; is_hitting_anim = True; stick_rotation = 60
-                    elif state == "WIN": return run_tio_game(character_name)
+                    if game.state == "PROMPT": game.hit()
+                    elif game.state == "WIN":
+                        game.reset()
+                        if dirty: dirty.invalidate()
 
-        if bg_img: screen.blit(bg_img, (0,0))
-        else: screen.fill((200, 180, 160)) 
-        
+        state = game.state; is_hitting_anim = game.is_hitting_anim
         curr_tio = tio_cop_img if is_hitting_anim else tio_img
         tio_rect = curr_tio.get_rect(); tio_rect.bottomleft = (WIDTH * 0.05, HEIGHT * 0.90)
         draw_x, draw_y = tio_rect.x, tio_rect.y
         if is_hitting_anim: draw_x += random.randint(-5, 5); draw_y += random.randint(-5, 5)
-        screen.blit(curr_tio, (draw_x, draw_y))
-        
-        screen.blit(player_mini_img, (20, 20))
-        draw_paper_box(screen, pygame.Rect(20 + player_mini_img.get_width() + 10, 30, 350, 60), font_ui.render(f"Cops: {hits_current} / {hits_needed}", True, TEXT_COLOR))
-
-        if state == "PROMPT":
-            ptxt = font_title.render("COP DE BASTÓ!", True, TEXT_COLOR)
-            prect = pygame.Rect(0,0, ptxt.get_width()+60, ptxt.get_height()+30); prect.center = (WIDTH//2, HEIGHT*0.3)
-            pygame.draw.rect(screen, PAPER_COLOR, prect, border_radius=25); pygame.draw.rect(screen, CHRISTMAS_RED, prect, 8, border_radius=25); screen.blit(ptxt, ptxt.get_rect(center=prect.center))
-        if state == "MISS":
-            mtxt = font_title.render("Massa lent!", True, CHRISTMAS_RED)
-            mrect = pygame.Rect(0,0, mtxt.get_width()+60, mtxt.get_height()+30); mrect.center = (WIDTH//2, HEIGHT*0.3)
-            pygame.draw.rect(screen, PAPER_COLOR, mrect, border_radius=25); pygame.draw.rect(screen, CHRISTMAS_RED, mrect, 8, border_radius=25); screen.blit(mtxt, mtxt.get_rect(center=mrect.center))
-
-        cur_ang = 45 + stick_rotation; rot_stick = pygame.transform.rotate(stick_img, cur_ang)
-        st_rect = rot_stick.get_rect(); st_rect.bottomright = (WIDTH * 0.75, HEIGHT * 1.1)
-        screen.blit(rot_stick, st_rect)
+        counter_rect = pygame.Rect(20 + player_mini_img.get_width() + 10, 30, 350, 60)
+        counter_txt = render_text(font_ui, f"Cops: {game.hits_current} / {hits_needed}", True, TEXT_COLOR)
 
-        if state == "WIN":
-             s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); s.fill((0,0,0,180)); screen.blit(s, (0,0))
-             wtxt = font_big.render("CAAAAAGAAA TIÓ!!!", True, GOLD); gtxt = font_ui.render("Pots obrir el següent regal", True, WHITE)
-             screen.blit(wtxt, wtxt.get_rect(center=(WIDTH//2, HEIGHT//2))); screen.blit(gtxt, gtxt.get_rect(center=(WIDTH//2, HEIGHT//2 + 100)))
+        banner = None
+        if state == "PROMPT": banner = (render_text(font_title, "COP DE BASTÓ!", True, TEXT_COLOR), state)
+        if state == "MISS": banner = (render_text(font_title, "Massa lent!", True, CHRISTMAS_RED), state)
+        if banner:
+            banner_rect = pygame.Rect(0,0, banner[0].get_width()+60, banner[0].get_height()+30); banner_rect.center = (WIDTH//2, HEIGHT*0.3)
 
-        pygame.display.flip(); clock.tick(FPS)
+        cur_ang = 45 + game.prev_stick_rotation + (game.stick_rotation - game.prev_stick_rotation) * game.ticker.alpha; rot_stick = counted(pygame.transform.rotate(stick_img, cur_ang))
+        st_rect = rot_stick.get_rect(); st_rect.bottomright = (WIDTH * 0.75, HEIGHT * 1.1)
+
+        def draw():
+            if bg_img: screen.blit(bg_img, (0,0))
+            else: screen.fill((200, 180, 160)) 
+            screen.blit(curr_tio, (draw_x, draw_y))
+            screen.blit(player_mini_img, (20, 20))
+            draw_paper_box(screen, counter_rect, counter_txt)
+            if banner:
+                pygame.draw.rect(screen, PAPER_COLOR, banner_rect, border_radius=25); pygame.draw.rect(screen, CHRISTMAS_RED, banner_rect, 8, border_radius=25); screen.blit(banner[0], banner[0].get_rect(center=banner_rect.center))
+            screen.blit(rot_stick, st_rect)
+            if state == "WIN":
+                 screen.blit(translucent((WIDTH, HEIGHT), (0,0,0,180)), (0,0))
+                 wtxt = render_text(font_big, "CAAAAAGAAA TIÓ!!!", True, GOLD); gtxt = render_text(font_ui, "Pots obrir el següent regal", True, WHITE)
+                 screen.blit(wtxt, wtxt.get_rect(center=(WIDTH//2, HEIGHT//2))); screen.blit(gtxt, gtxt.get_rect(center=(WIDTH//2, HEIGHT//2 + 100)))
+
+        if dirty:
+            dirty.track("tio", (draw_x, draw_y, curr_tio.get_width(), curr_tio.get_height()), is_hitting_anim)
+            dirty.track("counter", counter_rect, game.hits_current)
+            dirty.track("banner", banner_rect if banner else None, banner and banner[1])
+            dirty.track("stick", st_rect, cur_ang)
+            dirty.track("win", screen.get_rect(), state == "WIN")
+        render_scene(dirty, draw)
 
 # ==============================================================================
 # JOC 3: SOPA DE LLETRES
 # ==============================================================================
 
+SOUP_WORDS = ["CANELONS", "POLVORONS", "ESCUDELLA", "TORRO", "NEULES", "GALETS", "CAVA", "TORTELL"]
+# Vocabulari per a sopes grans (cap paraula en conté cap altra, ni del dret ni del revés)
+SOUP_WORDS_EXTRA = [
+    "NADAL", "PESSEBRE", "CAGANER", "TIO", "REIS", "ESTEL", "AVET", "BOLA", "GARLANDA", "REGAL",
+    "CAMELLS", "PASTORS", "ANGELS", "ESPELMA", "CAMPANA", "MOLSA", "SURO", "TRINEU", "RENS", "MISSA",
+    "FESTA", "FAMILIA", "SOPAR", "ESTRENES", "PANDERETA", "XAMPANY", "MANDARINA", "AMETLLES", "FIGUES", "HIVERN",
+    "FRED", "ESTRELLA", "LLUMS", "CORONA", "CINTA", "MITJO", "BARRET", "BUFANDA", "GUANTS", "XOCOLATA",
+    "PATGE", "CARTA", "SANTESTEVE", "ANYNOU", "NEVADA", "LLAMINADURES",
+]
+SOUP_DIRECTIONS = ((0, 1), (1, 0), (1, 1), (-1, 1), (0, -1), (-1, 0), (-1, -1), (1, -1))
+SOUP_GEN_BUDGET_MS = 150
+soup_size = (12, 12, 5)  # files, columnes, paraules (--soup 30x30:40 per a sopes més difícils)
+
+def parse_soup_size(text):
+    """'30x30:40' -> (30, 30, 40)"""
+    dims, _, count = text.lower().partition(":")
+    rows, cols = (int(v) for v in dims.split("x"))
+    return rows, cols, int(count or soup_size[2])
+
+def soup_board_origin(rows, cols, word_count):
+    """(cel·la, x, y) del tauler: ocupa el 78% de l'alçada, centrat o a l'esquerra de la llista si és llarga"""
+    cell = int(HEIGHT * 0.78 / max(rows, cols))
+    bx = (WIDTH - cols * cell) // 2; by = (HEIGHT - rows * cell) // 2
+    if word_count > 7: bx = max(20, min(bx, WIDTH - 410 - cols * cell))
+    return cell, bx, by
+
+# Índex de col·locacions possibles: (files, columnes, llargada) -> llista de tuples de cel·les
+# (índex pla fila * columnes + columna) en les vuit direccions; es calcula un sol cop per mida
+soup_placement_index = {}
+
+def soup_placements(rows, cols, length):
+    key = (rows, cols, length)
+    cands = soup_placement_index.get(key)
+    if cands is None:
+        cands = []
+        for dr, dc in SOUP_DIRECTIONS:
+            span_r, span_c = dr * (length - 1), dc * (length - 1)
+            for r in range(max(0, -span_r), min(rows, rows - span_r)):
+                for c in range(max(0, -span_c), min(cols, cols - span_c)):
+                    cands.append(tuple((r + dr * i) * cols + c + dc * i for i in range(length)))
+        soup_placement_index[key] = cands
+    return cands
+
+def lazy_shuffle(seq, rng):
+    """Recorre 'seq' en ordre aleatori barrejant només el que es consumeix (Fisher-Yates incremental)"""
+    idx = list(range(len(seq)))
+    for n in range(len(idx), 0, -1):
+        j = int(rng.random() * n)
+        idx[j], idx[n - 1] = idx[n - 1], idx[j]
+        yield seq[idx[n - 1]]
+
+def generate_word_search(words, rows, cols, budget_ms=SOUP_GEN_BUDGET_MS, rng=random):
+    """
+    Col·loca 'words' en una graella rows x cols (vuit direccions, encreuaments permesos si la lletra coincideix)
+    amb una cerca amb retrocés sobre l'índex de col·locacions; les paraules llargues van primer.
+    Esgotat el pressupost de temps ja no es desfà res: la paraula que no cap es descarta.
+    Retorna (graella amb '' a les cel·les buides, {paraula: [(fila, col), ...]}, paraules no col·locades).
+    """
+    words = [w.upper() for w in words]
+    order = sorted((w for w in words if soup_placements(rows, cols, len(w))), key=len, reverse=True)
+    deadline = time.perf_counter() + budget_ms / 1000  # l'índex (un sol cop per mida) no compta
+    unplaced = [w for w in words if w not in order]
+    cells = [''] * (rows * cols)
+    written = [None] * len(order)  # cel·les que ha omplert cada paraula (per desfer-les)
+    chosen = [None] * len(order)
+    iters = [None] * len(order)
+    i = 0
+    while i < len(order):
+        word = order[i]
+        if iters[i] is None: iters[i] = lazy_shuffle(soup_placements(rows, cols, len(word)), rng)
+        pick = None
+        for n, cand in enumerate(iters[i]):
+            new = 0
+            for k, ch in zip(cand, word):
+                cur = cells[k]
+                if cur == '': new += 1
+                elif cur != ch: break
+            else:
+                if new: pick = cand; break  # si no omple cap cel·la nova seria una còpia d'una altra paraula
+            if n & 255 == 255 and time.perf_counter() > deadline: break
+        if pick is not None:
+            written[i] = [k for k in pick if cells[k] == '']
+            for k, ch in zip(pick, word): cells[k] = ch
+            chosen[i] = pick; i += 1
+            continue
+        iters[i] = None
+        if i == 0 or time.perf_counter() > deadline:
+            unplaced.append(order.pop(i)); written.pop(i); chosen.pop(i); iters.pop(i)
+            continue
+        i -= 1  # retrocés: desfà l'anterior i prova la seva següent col·locació
+        for k in written[i]: cells[k] = ''
+    grid = [cells[r * cols:(r + 1) * cols] for r in range(rows)]
+    placements = {w: [divmod(k, cols) for k in cand] for w, cand in zip(order, chosen)}
+    return grid, placements, [w for w in words if w in unplaced]
+
+class WordIndex:
+    """Autòmat d'Aho-Corasick sobre les paraules de la sopa: troba totes les aparicions en una línia d'una sola passada"""
+    def __init__(self, words):
+        self.goto = [{}]; self.fail = [0]; self.out = [()]
+        for w in words:
+            node = 0
+            for ch in w:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto); self.goto[node][ch] = nxt
+                    self.goto.append({}); self.fail.append(0); self.out.append(())
+                node = nxt
+            self.out[node] += (w,)
+        queue = deque(self.goto[0].values())  # els fills de l'arrel fallen cap a l'arrel
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]: f = self.fail[f]
+                if node: self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+
+    def scan(self, text):
+        """(posició inicial, paraula) de cada aparició dins 'text'"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self.goto[node]: node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for w in self.out[node]: yield i - len(w) + 1, w
+
+    def occurrences(self, grid):
+        """{paraula: [cel·les de cada aparició]} llegint totes les files, columnes i diagonals en els dos sentits"""
+        rows, cols = len(grid), len(grid[0])
+        found = {}
+        for dr, dc in SOUP_DIRECTIONS[:4]:
+            for r in range(rows):
+                for c in range(cols):
+                    if 0 <= r - dr < rows and 0 <= c - dc < cols: continue  # no és l'inici de la línia
+                    line = []; lr, lc = r, c
+                    while 0 <= lr < rows and 0 <= lc < cols: line.append((lr, lc)); lr += dr; lc += dc
+                    for cells in (line, line[::-1]):
+                        for start, w in self.scan(''.join(grid[lr][lc] for lr, lc in cells)):
+                            occ = cells[start:start + len(w)]
+                            if cells is line or set(occ) not in (set(o) for o in found.get(w, ())):  # palíndroms
+                                found.setdefault(w, []).append(occ)
+        return found
+
+SOUP_REPAIR_PASSES = 20
+SOUP_GEN_ATTEMPTS = 10
+
+def fill_word_search(grid, placements, rng=random):
+    """
+    Omple les cel·les buides amb lletres a l'atzar i torna a sortejar les que formen una segona còpia
+    d'alguna paraula, fins que cadascuna apareix exactament un cop. Retorna les paraules que encara hi
+    surten més d'un cop (p.ex. dues paraules encreuades en formen una tercera); buida si tot ha anat bé.
+    """
+    index = WordIndex(placements)
+    free = [(r, c) for r, row in enumerate(grid) for c, ch in enumerate(row) if ch == '']
+    for r, c in free: grid[r][c] = rng.choice(string.ascii_uppercase)
+    free = set(free)
+    for _ in range(SOUP_REPAIR_PASSES):
+        extra = [(w, occ) for w, occs in index.occurrences(grid).items() for occ in occs if set(occ) != set(placements[w])]
+        if not extra: return []
+        if any(not free.intersection(occ) for _, occ in extra): break  # còpia feta només de paraules col·locades
+        for _, occ in extra:
+            r, c = rng.choice([cell for cell in occ if cell in free]); grid[r][c] = rng.choice(string.ascii_uppercase)
+    return sorted({w for w, occs in index.occurrences(grid).items() for occ in occs if set(occ) != set(placements[w])})
+
 def run_soup_game(character_name):
-    ROWS, COLS = 12, 12; CELL_SIZE = int(HEIGHT * 0.065)
+    ROWS, COLS, WORD_COUNT = soup_size; CELL_SIZE, bx, by = soup_board_origin(ROWS, COLS, WORD_COUNT)
     BOARD_W = COLS * CELL_SIZE; BOARD_H = ROWS * CELL_SIZE
-    ALL = ["CANELONS", "POLVORONS", "ESCUDELLA", "TORRO", "NEULES", "GALETS", "CAVA", "TORTELL"]
-    targets = random.sample(ALL, 5); found = []; found_cells = [] 
-    grid = [['' for _ in range(COLS)] for _ in range(ROWS)]
-    
-    def place(w):
-        w = w.upper()
-        for _ in range(100):
-            d = random.choice([(0,1), (1,0), (1,1)]); sr = random.randint(0, ROWS-1); sc = random.randint(0, COLS-1)
-            if 0<=sr+d[0]*(len(w)-1)<ROWS and 0<=sc+d[1]*(len(w)-1)<COLS:
-                can = True
-                for i in range(len(w)):
-                    if grid[sr+d[0]*i][sc+d[1]*i] not in ['', w[i]]: can = False; break
-                if can:
-                    for i in range(len(w)): grid[sr+d[0]*i][sc+d[1]*i] = w[i]
-                    return True
-        return False
-    for w in targets: place(w)
-    chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    for r in range(ROWS):
-        for c in range(COLS): 
-            if grid[r][c] == '': grid[r][c] = random.choice(chars)
-
+    ALL = SOUP_WORDS if WORD_COUNT <= len(SOUP_WORDS) else SOUP_WORDS + SOUP_WORDS_EXTRA
+    cell_font = font_soup if max(ROWS, COLS) <= 12 else font_soup_small
     bg = None
-    if os.path.exists("fons_cuina.png"): bg = pygame.transform.smoothscale(pygame.image.load("fons_cuina.png").convert(), (WIDTH, HEIGHT))
+    if os.path.exists("fons_cuina.png"): bg = load_image("fons_cuina.png", (WIDTH, HEIGHT), alpha=False)
     mini = load_face(character_name, 80)
-    
-    sel_s = None; sel_e = None; selecting = False; won = False
-    bx = (WIDTH - BOARD_W) // 2; by = (HEIGHT - BOARD_H) // 2
+    highlight_tile = translucent((CELL_SIZE, CELL_SIZE), SOUP_HIGHLIGHT)
+
+    class SoupSession:
+        """Estat d'una partida; reset() genera una sopa nova i la repinta sobre la mateixa capa del tauler"""
+        def __init__(self):
+            # Tauler pre-renderitzat: fons, vores i lletres es pinten un sol cop per sopa
+            self.board_layer = counted(pygame.Surface((BOARD_W + 40, BOARD_H + 40), pygame.SRCALPHA))
+            self.reset()
+        def reset(self):
+            for _ in range(SOUP_GEN_ATTEMPTS):
+                self.targets = random.sample(ALL, min(WORD_COUNT, len(ALL))); self.found = []
+                self.grid, self.placements, unplaced = generate_word_search(self.targets, ROWS, COLS)
+                repeated = fill_word_search(self.grid, self.placements)
+                if not repeated: break
+            # Si cap intent no surt net, es queda l'última sopa sense les paraules que hi surten repetides
+            if repeated:
+                print(f"Sopa de lletres: {', '.join(repeated)} hi surten més d'un cop i es treuen de la llista")
+                for w in repeated: del self.placements[w]
+            if unplaced: print(f"Sopa de lletres: no s'han pogut col·locar {', '.join(unplaced)}")
+            if unplaced or repeated: self.targets = [w for w in self.targets if w in self.placements]
+            # Cada paraula hi és un sol cop: els extrems d'una selecció n'identifiquen la paraula
+            self.word_at = {}
+            for w, cells in self.placements.items(): self.word_at[(cells[0], cells[-1])] = self.word_at[(cells[-1], cells[0])] = w
+            self.sel_s = None; self.sel_e = None; self.selecting = False; self.won = False
+            self.hint = None  # paraula de la qual es ressalta la primera lletra (tecla H)
+            self.board_layer.fill((255, 255, 255, 200)) # Blanco semitransparente
+            pygame.draw.rect(self.board_layer, BLACK, self.board_layer.get_rect(), 4)
+            for r in range(ROWS):
+                for c in range(COLS): self.paint_cell(r, c)
+        def paint_cell(self, r, c, is_found=False):
+            rect = pygame.Rect(20+c*CELL_SIZE, 20+r*CELL_SIZE, CELL_SIZE, CELL_SIZE)
+            if is_found: pygame.draw.rect(self.board_layer, (144,238,144), rect)
+            pygame.draw.rect(self.board_layer, BLACK, rect, 1)
+            l = render_text(cell_font, self.grid[r][c], True, BLACK); self.board_layer.blit(l, l.get_rect(center=rect.center))
+
+    game = SoupSession()
     
     while True:
-        mx, my = pygame.mouse.get_pos()
-        for e in pygame.event.get():
+        mx, my = get_mouse_pos()
+        grid = game.grid; targets = game.targets; found = game.found
+        for e in get_events("soup"):
             if e.type == pygame.QUIT: pygame.quit(); sys.exit()
             if e.type == pygame.KEYDOWN:
                 if e.key == pygame.K_ESCAPE: return
-                if e.key == pygame.K_SPACE and won: return run_soup_game(character_name)
-            if not won:
+                if e.key == pygame.K_SPACE and game.won:
+                    game.reset(); grid = game.grid; targets = game.targets; found = game.found
+                    continue
+                if e.key == pygame.K_h and not game.won:
+                    game.hint = next((w for w in targets if w not in found), None)
+            if not game.won:
                 if e.type == pygame.MOUSEBUTTONDOWN and bx<=mx<bx+BOARD_W and by<=my<by+BOARD_H:
-                    c=(mx-bx)//CELL_SIZE; r=(my-by)//CELL_SIZE; sel_s=(r,c); sel_e=(r,c); selecting=True
-                elif e.type == pygame.MOUSEMOTION and selecting:
-                    if bx<=mx<bx+BOARD_W and by<=my<by+BOARD_H: c=(mx-bx)//CELL_SIZE; r=(my-by)//CELL_SIZE; sel_e=(r,c)
-                elif e.type == pygame.MOUSEBUTTONUP and selecting:
-                    selecting=False; r1,c1=sel_s; r2,c2=sel_e; dr,dc=r2-r1,c2-c1; steps=max(abs(dr),abs(dc)); steps=1 if steps==0 else steps
-                    dr=0 if dr==0 else dr//abs(dr); dc=0 if dc==0 else dc//abs(dc)
-                    if (dr==0 or dc==0 or abs(dr)==abs(dc)):
-                        word=""; coords=[]
-                        for i in range(steps+1): cr,cc=r1+dr*i,c1+dc*i; word+=grid[cr][cc]; coords.append((cr,cc))
-                        f=False
-                        if word in targets and word not in found: found.append(word); f=True
-                        elif word[::-1] in targets and word[::-1] not in found: found.append(word[::-1]); f=True
-                        if f: found_cells.extend(coords)
-                    sel_s=None; sel_e=None
-                    if len(found)==len(targets): won=True
-
+                    c=(mx-bx)//CELL_SIZE; r=(my-by)//CELL_SIZE; game.sel_s=(r,c); game.sel_e=(r,c); game.selecting=True
+                elif e.type == pygame.MOUSEMOTION and game.selecting:
+                    if bx<=mx<bx+BOARD_W and by<=my<by+BOARD_H: c=(mx-bx)//CELL_SIZE; r=(my-by)//CELL_SIZE; game.sel_e=(r,c)
+                elif e.type == pygame.MOUSEBUTTONUP and game.selecting:
+                    game.selecting=False
+                    word = game.word_at.get((game.sel_s, game.sel_e))
+                    if word in targets and word not in found:
+                        found.append(word)
+                        for cr,cc in game.placements[word]: game.paint_cell(cr, cc, True)
+                    game.sel_s=None; game.sel_e=None
+                    if len(found)==len(targets): game.won=True
+
+        mark_draw()
         if bg: screen.blit(bg, (0,0))
         else: screen.fill((200,200,200))
         
-        s_board_bg = pygame.Surface((BOARD_W + 40, BOARD_H + 40), pygame.SRCALPHA)
-        s_board_bg.fill((255, 255, 255, 200)) # Blanco semitransparente
-        screen.blit(s_board_bg, (bx - 20, by - 20))
-        pygame.draw.rect(screen, BLACK, pygame.Rect(bx - 20, by - 20, BOARD_W + 40, BOARD_H + 40), 4)
-        
-        for r in range(ROWS):
-            for c in range(COLS):
-                rect = pygame.Rect(bx+c*CELL_SIZE, by+r*CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                if (r,c) in found_cells: pygame.draw.rect(screen, (144,238,144), rect)
-                pygame.draw.rect(screen, BLACK, rect, 1)
-                l = font_soup.render(grid[r][c], True, BLACK); screen.blit(l, l.get_rect(center=rect.center))
-
-        if selecting and sel_s and sel_e:
-            r1,c1=sel_s; r2,c2=sel_e; dr,dc=r2-r1,c2-c1; steps=max(abs(dr),abs(dc)); steps=1 if steps==0 else steps
+        screen.blit(game.board_layer, (bx - 20, by - 20))
+
+        if game.hint and game.hint not in found:
+            hr, hc = game.placements[game.hint][0]
+            screen.blit(translucent((CELL_SIZE, CELL_SIZE), SOUP_HINT), (bx+hc*CELL_SIZE, by+hr*CELL_SIZE))
+
+        if game.selecting and game.sel_s and game.sel_e:
+            r1,c1=game.sel_s; r2,c2=game.sel_e; dr,dc=r2-r1,c2-c1; steps=max(abs(dr),abs(dc)); steps=1 if steps==0 else steps
             dr=0 if dr==0 else dr//abs(dr); dc=0 if dc==0 else dc//abs(dc)
             if (dr==0 or dc==0 or abs(dr)==abs(dc)):
                 for i in range(steps+1):
-                    h_rect = pygame.Rect(bx+(c1+dc*i)*CELL_SIZE, by+(r1+dr*i)*CELL_SIZE, CELL_SIZE, CELL_SIZE)
-                    sh = pygame.Surface((CELL_SIZE,CELL_SIZE), pygame.SRCALPHA); sh.fill(SOUP_HIGHLIGHT); screen.blit(sh, h_rect)
+                    screen.blit(highlight_tile, (bx+(c1+dc*i)*CELL_SIZE, by+(r1+dr*i)*CELL_SIZE))
 
         screen.blit(mini, (20,20))
-        draw_paper_box(screen, pygame.Rect(20+mini.get_width()+10, 30, 380, 60), font_ui.render(f"Paraules: {len(found)} / {len(targets)}", True, TEXT_COLOR))
+        draw_paper_box(screen, pygame.Rect(20+mini.get_width()+10, 30, 380, 60), render_text(font_ui, f"Paraules: {len(found)} / {len(targets)}", True, TEXT_COLOR))
+        if not game.won: screen.blit(render_text(font_soup_small, "H: pista", True, TEXT_COLOR), (20+mini.get_width()+30, 100))
         
         ly = 150; lbw = 350; lbh = 320; lbx = WIDTH - lbw - 30; lby = ly - 20
-        sl = pygame.Surface((lbw, lbh), pygame.SRCALPHA); sl.fill((255,255,255,200)); screen.blit(sl, (lbx, lby))
+        if len(targets) <= 7: list_font, line_h, per_col = font_ui, 40, 7
+        else:  # llistes llargues: lletra petita i en columnes
+            list_font = font_soup_small; line_h = max(12, int(HEIGHT * 0.03))
+            per_col = max(1, (HEIGHT - lby - 80) // line_h)
+            lbh = max(lbh, 60 + min(len(targets), per_col) * line_h)
+        col_w = (lbw - 40) // math.ceil(len(targets) / per_col) if targets else lbw
+        screen.blit(translucent((lbw, lbh), (255,255,255,200)), (lbx, lby))
         pygame.draw.rect(screen, BLACK, (lbx, lby, lbw, lbh), 4)
-        screen.blit(font_ui.render("LLISTA:", True, BLACK), (lbx+20, ly))
+        screen.blit(render_text(font_ui, "LLISTA:", True, BLACK), (lbx+20, ly))
         for i,w in enumerate(targets):
             col = CHRISTMAS_GREEN if w in found else BLACK
-            screen.blit(font_ui.render(w, True, col), (lbx+20, ly+40+i*40))
+            screen.blit(render_text(list_font, w, True, col), (lbx+20+(i//per_col)*col_w, ly+40+(i%per_col)*line_h))
 
-        if won:
-             s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); s.fill((0,0,0,180)); screen.blit(s, (0,0))
-             screen.blit(font_big.render("MOLT BÉ!!!", True, GOLD), font_big.render("MOLT BÉ!!!", True, GOLD).get_rect(center=(WIDTH//2, HEIGHT//2)))
-             sub = font_ui.render("Pots obrir el següent regal", True, WHITE); screen.blit(sub, sub.get_rect(center=(WIDTH//2, HEIGHT//2 + 100)))
+        if game.won:
+             screen.blit(translucent((WIDTH, HEIGHT), (0,0,0,180)), (0,0))
+             wtxt = render_text(font_big, "MOLT BÉ!!!", True, GOLD); screen.blit(wtxt, wtxt.get_rect(center=(WIDTH//2, HEIGHT//2)))
+             sub = render_text(font_ui, "Pots obrir el següent regal", True, WHITE); screen.blit(sub, sub.get_rect(center=(WIDTH//2, HEIGHT//2 + 100)))
 
-        pygame.display.flip(); clock.tick(FPS)
+        end_frame()
 
 # ==============================================================================
 # JOC 4: L'AVENTURA DELS REGALS (PLATAFORMES MARIO STYLE)
 # ==============================================================================
 
+LEVEL_FILE = "nivell_regals.txt"
+level_file = LEVEL_FILE  # --level FITXER (p.ex. nivell_grinch.txt, amb centenars de grinch)
+TILE_EMPTY = 0; TILE_GROUND = 1; TILE_PLATFORM = 2
+LEVEL_TILE_IDS = {'X': TILE_GROUND, '#': TILE_PLATFORM}
+LEVEL_ENTITY_CHARS = "PGRS"
+
+class LevelData:
+    """
+    Nivell en format compacte: els tiles són un bytearray ordenat per columnes
+    (index = col * rows + row) i les entitats una llista (col, row, tipus) ordenada per columna.
+    """
+    def __init__(self, cols, rows, tiles, entities):
+        self.cols = cols
+        self.rows = rows
+        self.tiles = tiles
+        self.entities = entities
+        self.entity_cols = [e[0] for e in entities]
+
+    def tile(self, col, row):
+        return self.tiles[col * self.rows + row]
+
+    def column_range(self, c0, c1):
+        """Tiles de les columnes [c0, c1) sense copiar el buffer"""
+        return memoryview(self.tiles)[c0 * self.rows:c1 * self.rows]
+
+    def entities_in(self, c0, c1):
+        return self.entities[bisect.bisect_left(self.entity_cols, c0):bisect.bisect_left(self.entity_cols, c1)]
+
+    def count(self, kind):
+        return sum(1 for e in self.entities if e[2] == kind)
+
+def load_level(path):
+    """Llegeix un fitxer de nivell (mapa ASCII, una fila per línia; ';' per comentaris)"""
+    with open(path, encoding="utf-8") as f:
+        lines = [l.rstrip("\r\n") for l in f if not l.startswith(";")]
+    rows = len(lines); cols = max(len(l) for l in lines)
+    tiles = bytearray(cols * rows)
+    entities = []
+    for row, line in enumerate(lines):
+        for col, cell in enumerate(line):
+            if cell in LEVEL_TILE_IDS: tiles[col * rows + row] = LEVEL_TILE_IDS[cell]
+            elif cell in LEVEL_ENTITY_CHARS: entities.append((col, row, cell))
+    entities.sort()
+    return LevelData(cols, rows, tiles, entities)
+
 def run_platformer_game(character_name):
     GRAVITY = 0.8
     JUMP_POWER = -25
     MOVE_SPEED = 9
     TILE_SIZE = 80 
+    ENEMY_JUMP_CHANCE = 0.02  # probabilitat de salt per pas d'un grinch a terra
     
     def load_img(name, scale_w=None, scale_h=None):
         if os.path.exists(name):
-            img = pygame.image.load(name).convert_alpha()
             if scale_w and scale_h:
-                return pygame.transform.smoothscale(img, (scale_w, scale_h))
-            return img
+                return load_image(name, (scale_w, scale_h))
+            return load_image(name)
         else:
-            s = pygame.Surface((scale_w if scale_w else 50, scale_h if scale_h else 50))
+            s = counted(pygame.Surface((scale_w if scale_w else 50, scale_h if scale_h else 50)))
             s.fill((255, 0, 255))
             return s
 
@@ -432,26 +1557,30 @@ def run_platformer_game(character_name):
     class Enemy(pygame.sprite.Sprite):
         def __init__(self, x, y, limit_left, limit_right):
             super().__init__()
+            self.spawn = (x, y)
+            self.limit_left = limit_left
+            self.limit_right = limit_right
+            self.jump_power = JUMP_POWER * 0.65 
+            self.reset()
+
+        def reset(self):
             self.image = grinch_img
             self.rect = self.image.get_rect()
-            self.rect.x = x
-            self.rect.bottom = y
+            self.rect.x, self.rect.bottom = self.spawn
+            self.prev_pos = self.rect.topleft
             self.speed = 3
-            self.limit_left = limit_left
-            self.limit_right = limit_right
             self.vel_y = 0 
             self.on_ground = False
-            self.jump_power = JUMP_POWER * 0.65 
 
-        def update(self, blocks):
+        def update(self, tiles):
             self.rect.x += self.speed
             if self.rect.right > self.limit_right or self.rect.left < self.limit_left:
                 self.speed *= -1
-                self.image = pygame.transform.flip(self.image, True, False)
+                self.image = counted(pygame.transform.flip(self.image, True, False))
             self.vel_y += GRAVITY
             self.rect.y += self.vel_y
             self.on_ground = False
-            hits = pygame.sprite.spritecollide(self, blocks, False)
+            hits = tiles.collide(self.rect)
             for block in hits:
                 if self.vel_y > 0:
                     self.rect.bottom = block.rect.top
@@ -460,7 +1589,7 @@ def run_platformer_game(character_name):
                 elif self.vel_y < 0:
                     self.rect.top = block.rect.bottom
                     self.vel_y = 0
-            if self.on_ground and random.random() < 0.02: 
+            if self.on_ground and random.random() < ENEMY_JUMP_CHANCE: 
                 self.vel_y = self.jump_power
 
     class Gift(pygame.sprite.Sprite):
@@ -471,6 +1600,9 @@ def run_platformer_game(character_name):
             self.rect.x = x
             self.rect.y = y
 
+        def reset(self):
+            pass  # no es mou: n'hi ha prou de tornar-lo als grups
+
     class Goal(pygame.sprite.Sprite):
         def __init__(self, x, y):
             super().__init__()
@@ -479,39 +1611,46 @@ def run_platformer_game(character_name):
             self.rect.x = x
             self.rect.bottom = y
 
+        def reset(self):
+            pass
+
     class Player(pygame.sprite.Sprite):
         def __init__(self, x, y):
             super().__init__()
+            self.spawn = (x, y)
+            self.reset()
+
+        def reset(self):
             self.image = player_img
             self.rect = self.image.get_rect()
             self.rect.inflate_ip(-20, -10) 
-            self.rect.x = x
-            self.rect.bottom = y
+            self.rect.x, self.rect.bottom = self.spawn
+            self.prev_pos = self.rect.topleft
             self.vel_y = 0
             self.on_ground = False
             self.facing_right = True
             
-        def update(self, keys, blocks):
+        def update(self, keys, tiles):
             dx = 0
             if keys[pygame.K_LEFT] or keys[pygame.K_a]:
                 dx = -MOVE_SPEED
                 if self.facing_right:
-                    self.image = pygame.transform.flip(self.image, True, False)
+                    self.image = counted(pygame.transform.flip(self.image, True, False))
                     self.facing_right = False
             if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
                 dx = MOVE_SPEED
                 if not self.facing_right:
-                    self.image = pygame.transform.flip(self.image, True, False)
+                    self.image = counted(pygame.transform.flip(self.image, True, False))
                     self.facing_right = True
             self.rect.x += dx
-            hits = pygame.sprite.spritecollide(self, blocks, False)
+            hits = tiles.collide(self.rect)
             for block in hits:
                 if dx > 0: self.rect.right = block.rect.left
                 elif dx < 0: self.rect.left = block.rect.right
             self.vel_y += GRAVITY
             self.rect.y += self.vel_y
             self.on_ground = False
-            hits = pygame.sprite.spritecollide(self, blocks, False)
+            hits = tiles.collide(self.rect)
             for block in hits:
                 if self.vel_y > 0:
                     self.rect.bottom = block.rect.top
@@ -525,152 +1664,503 @@ def run_platformer_game(character_name):
             if self.on_ground:
                 self.vel_y = JUMP_POWER
 
-    # --- DISSSENY DE NIVELL (USER MAP) ---
-    level_map = [
-        "                                                                                                                                                                                                     ",
-        "                                                                                                                                                                                                     ",
-        "                          R                                                                                                                                                                          ",
-        "                         ###                                               R           R                         R                                                                                   ",
-        "        R                                               R                 ###         ###     G           G            G                                R                                            ",
-        "       ###          ###                                ###                           ###              #########       #####                        ##########                                        ",
-        "                                     R                              G              R                                                          R                            R                         ",
-        " P            G                   #######        G                 ###            XXXXXXXXXX         G                                                                     G                    S    ",
-        "XXXXX     XXXXXXXXXX     XXXXX               XXXXXXXXX     XXXXX        XXXXX     XXXXXXXXXX     XXXXXXXXXXX                 XXXXXXXXXX     XXXXX             G        XXXXXXXXXXXX     XXXXXXXXXXXXX",
-        "XXXXX     XXXXXXXXXX     XXXXX               XXXXXXXXX     XXXXX        XXXXX     XXXXXXXXXX     XXXXXXXXXXX     XXXXX       XXXXXXXXXX     XXXXX          XXXXXXX     XXXXXXXXXXXX     XXXXXXXXXXXXX",
-        "XXXXX     XXXXXXXXXX     XXXXX               XXXXXXXXX     XXXXX        XXXXX     XXXXXXXXXX     XXXXXXXXXXX     XXXXX       XXXXXXXXXX     XXXXX          XXXXXXX     XXXXXXXXXXXX     XXXXXXXXXXXXX",
-        "XXXXX     XXXXXXXXXX     XXXXX               XXXXXXXXX     XXXXX        XXXXX     XXXXXXXXXX     XXXXXXXXXXX     XXXXX       XXXXXXXXXX     XXXXX          XXXXXXX     XXXXXXXXXXXX     XXXXXXXXXXXXX",
-        "XXXXX     XXXXXXXXXX     XXXXX               XXXXXXXXX     XXXXX        XXXXX     XXXXXXXXXX     XXXXXXXXXXX     XXXXX       XXXXXXXXXX     XXXXX          XXXXXXX     XXXXXXXXXXXX     XXXXXXXXXXXXX",
-        "XXXXX     XXXXXXXXXX     XXXXX               XXXXXXXXX     XXXXX        XXXXX     XXXXXXXXXX     XXXXXXXXXXX     XXXXX       XXXXXXXXXX     XXXXX          XXXXXXX     XXXXXXXXXXXX     XXXXXXXXXXXXX",
-    ]
-    
-    all_sprites = pygame.sprite.Group(); blocks = pygame.sprite.Group(); enemies = pygame.sprite.Group()
+    # --- NIVELL (carregat de fitxer, es construeix per trams a mesura que avança la càmera) ---
+    level = load_level(level_file)
+
+    class TileGrid:
+        """Índex de les plataformes per cel·la del mapa: cada col·lisió només mira les cel·les que toca"""
+        def __init__(self, cols, rows, origin_y):
+            self.cols = cols; self.rows = rows; self.origin_y = origin_y
+            self.cells = [None] * (cols * rows)
+            if np is not None:  # còpia en arrays per a les col·lisions en bloc dels grinch
+                self.solid = np.zeros((rows, cols), dtype=bool)
+                self.top_offset = np.zeros((rows, cols), dtype=np.int64)  # les plataformes flotants comencen més avall
+
+        def add(self, col, row, block):
+            self.cells[row * self.cols + col] = block
+            if np is not None:
+                self.solid[row, col] = True
+                self.top_offset[row, col] = block.rect.top - (self.origin_y + row * TILE_SIZE)
+
+        def collide(self, rect):
+            hits = []
+            c0 = max(0, rect.left // TILE_SIZE); c1 = min(self.cols - 1, (rect.right - 1) // TILE_SIZE)
+            r0 = max(0, (rect.top - self.origin_y) // TILE_SIZE); r1 = min(self.rows - 1, (rect.bottom - 1 - self.origin_y) // TILE_SIZE)
+            for r in range(r0, r1 + 1):
+                row_start = r * self.cols
+                for c in range(c0, c1 + 1):
+                    block = self.cells[row_start + c]
+                    if block is not None and rect.colliderect(block.rect): hits.append(block)
+            return hits
+
+        def first_hits(self, x, y, w, h):
+            """
+            Versió en bloc de collide() per a rectangles w x h a (x, y): per a cada un, si toca algun
+            bloc i el top i el bottom del primer que trobaria collide() (per files i després columnes)
+            """
+            n = len(x)
+            hit = np.zeros(n, dtype=bool); top = np.zeros(n, dtype=np.int64); bottom = np.zeros(n, dtype=np.int64)
+            c0 = np.maximum(0, x // TILE_SIZE); c1 = np.minimum(self.cols - 1, (x + w - 1) // TILE_SIZE)
+            r0 = np.maximum(0, (y - self.origin_y) // TILE_SIZE); r1 = np.minimum(self.rows - 1, (y + h - 1 - self.origin_y) // TILE_SIZE)
+            for dr in range((h + TILE_SIZE - 1) // TILE_SIZE + 1):
+                r = r0 + dr; rr = np.clip(r, 0, self.rows - 1)
+                for dc in range((w + TILE_SIZE - 1) // TILE_SIZE + 1):
+                    c = c0 + dc; cc = np.clip(c, 0, self.cols - 1)
+                    block_top = self.origin_y + rr * TILE_SIZE + self.top_offset[rr, cc]; block_bottom = self.origin_y + (rr + 1) * TILE_SIZE
+                    coll = (~hit & (r <= r1) & (c <= c1) & self.solid[rr, cc]
+                            & (x < cc * TILE_SIZE + TILE_SIZE) & (cc * TILE_SIZE < x + w) & (y < block_bottom) & (block_top < y + h))
+                    top[coll] = block_top[coll]; bottom[coll] = block_bottom[coll]; hit |= coll
+            return hit, top, bottom
+
+    class EnemySwarm:
+        """
+        Tots els grinch del nivell en arrays de NumPy, un element per grinch: patrulla, gravetat, salts
+        i col·lisió amb els tiles es calculen per a tots alhora (mateixes regles que Enemy.update).
+        'active' marca els dels trams ja creats que encara no s'han trepitjat.
+        """
+        def __init__(self, capacity):
+            self.count = 0
+            self.w, self.h = grinch_img.get_size()
+            self.images = (grinch_img, counted(pygame.transform.flip(grinch_img, True, False)))  # cap a la dreta / esquerra
+            self.jump_power = JUMP_POWER * 0.65
+            self.spawn_x = np.zeros(capacity, dtype=np.int64); self.spawn_y = np.zeros(capacity, dtype=np.int64)
+            self.limit_left = np.zeros(capacity, dtype=np.int64); self.limit_right = np.zeros(capacity, dtype=np.int64)
+            self.x = np.zeros(capacity, dtype=np.int64); self.y = np.zeros(capacity, dtype=np.int64)
+            self.prev_x = np.zeros(capacity, dtype=np.int64); self.prev_y = np.zeros(capacity, dtype=np.int64)
+            self.speed = np.zeros(capacity, dtype=np.int64); self.vel_y = np.zeros(capacity)
+            self.on_ground = np.zeros(capacity, dtype=bool); self.active = np.zeros(capacity, dtype=bool)
+            self.seq = np.zeros(capacity, dtype=np.int64)  # ordre d'aparició entre els sprites (per dibuixar)
+            self.rng = None  # clear() el crea a cada partida
+
+        def add(self, x, bottom, limit_left, limit_right):
+            i = self.count; self.count += 1
+            self.spawn_x[i] = x; self.spawn_y[i] = bottom - self.h
+            self.limit_left[i] = limit_left; self.limit_right[i] = limit_right
+            return i
+
+        def spawn(self, i, seq):
+            self.seq[i] = seq
+            self.x[i] = self.prev_x[i] = self.spawn_x[i]; self.y[i] = self.prev_y[i] = self.spawn_y[i]
+            self.speed[i] = 3; self.vel_y[i] = 0; self.on_ground[i] = False
+            self.active[i] = True
+
+        def clear(self):
+            self.active[:] = False
+            # Llavor treta de 'random' perquè les partides gravades (--record) es reprodueixin igual
+            self.rng = np.random.default_rng(random.getrandbits(32))
+
+        def update(self, tiles):
+            a = np.flatnonzero(self.active)
+            if not a.size: return
+            x = self.x[a]; y = self.y[a]
+            self.prev_x[a] = x; self.prev_y[a] = y
+            speed = self.speed[a]
+            x = x + speed
+            speed = np.where((x + self.w > self.limit_right[a]) | (x < self.limit_left[a]), -speed, speed)
+            vel_y = self.vel_y[a] + GRAVITY
+            y = y + vel_y; y = np.trunc(y + np.copysign(0.5, y)).astype(np.int64)  # com pygame.Rect amb floats
+            hit, top, bottom = tiles.first_hits(x, y, self.w, self.h)
+            down = hit & (vel_y > 0); up = hit & (vel_y < 0)
+            y = np.where(down, top - self.h, np.where(up, bottom, y))
+            vel_y[down | up] = 0
+            grounded = np.flatnonzero(down)
+            vel_y[grounded[self.rng.random(grounded.size) < ENEMY_JUMP_CHANCE]] = self.jump_power
+            self.x[a] = x; self.y[a] = y; self.speed[a] = speed; self.vel_y[a] = vel_y; self.on_ground[a] = down
+
+        def colliding(self, rect):
+            """Índexs dels grinch actius que toquen 'rect', en ordre de creació"""
+            return np.flatnonzero(self.active & (self.x < rect.right) & (rect.left < self.x + self.w)
+                                  & (self.y < rect.bottom) & (rect.top < self.y + self.h)).tolist()
+
+        def visible(self, view, cam_x, cam_y, alpha):
+            """[(seq, imatge, posició)] dels grinch actius dins de 'view', en ordre d'aparició"""
+            vis = np.flatnonzero(self.active & (self.x < view.right) & (view.left < self.x + self.w)
+                                 & (self.y < view.bottom) & (view.top < self.y + self.h))
+            vis = vis[np.argsort(self.seq[vis], kind="stable")]
+            xs = self.prev_x[vis] + (self.x[vis] - self.prev_x[vis]) * alpha - cam_x
+            ys = self.prev_y[vis] + (self.y[vis] - self.prev_y[vis]) * alpha - cam_y
+            return [(seq, self.images[left], (x, y)) for seq, x, y, left
+                    in zip(self.seq[vis].tolist(), xs.tolist(), ys.tolist(), (self.speed[vis] < 0).tolist())]
+
+    all_sprites = pygame.sprite.Group(); enemies = pygame.sprite.Group()
     gifts = pygame.sprite.Group(); goals = pygame.sprite.Group()
     
     player = None
-    level_width = len(level_map[0]) * TILE_SIZE
+    level_width = level.cols * TILE_SIZE
     
     # Ajustar posició inicial del dibuixat (Offset Y)
-    map_start_y = HEIGHT - (len(level_map) * TILE_SIZE) 
-    
-    for row_idx, row in enumerate(level_map):
-        for col_idx, cell in enumerate(row):
-            x = col_idx * TILE_SIZE
-            y = map_start_y + (row_idx * TILE_SIZE) 
-            
-            if cell == 'X':
-                p = Platform(x, y, block_img, is_floating=False); blocks.add(p); all_sprites.add(p)
-            elif cell == '#':
-                p = Platform(x, y, plat_img, is_floating=True); blocks.add(p); all_sprites.add(p)
-            elif cell == 'P':
-                player = Player(x, y + TILE_SIZE); all_sprites.add(player)
-            elif cell == 'G':
-                e = Enemy(x, y + TILE_SIZE, x - 200, x + 200); enemies.add(e); all_sprites.add(e)
-            elif cell == 'R':
-                g = Gift(x + 20, y + 20); gifts.add(g); all_sprites.add(g)
-            elif cell == 'S':
-                s = Goal(x, y + TILE_SIZE); goals.add(s); all_sprites.add(s)
-
-    # --- Càmera ---
-    camera_x = 0
+    map_start_y = HEIGHT - (level.rows * TILE_SIZE) 
+    tiles = TileGrid(level.cols, level.rows, map_start_y)
+    swarm = EnemySwarm(level.count('G')) if np is not None else None  # sense NumPy: un Enemy per grinch
+    terrain_chunks = []
+
+    class LevelStream:
+        """
+        Construeix el nivell per trams de l'amplada de pantalla: plataformes de col·lisió i
+        terreny pre-renderitzat (en tires per fila). Les entitats d'un tram es creen quan ja
+        s'ha carregat el tram següent, perquè els grinch no patrullin sobre terra inexistent.
+        En reiniciar la partida el terreny es conserva i les entitats ja creades es reaprofiten.
+        """
+        def __init__(self):
+            self.chunk_cols = max(1, WIDTH // TILE_SIZE)
+            self.num_chunks = -(-level.cols // self.chunk_cols)
+            self.loaded = 0
+            self.spawned = 0
+            self.spawn_seq = 0  # comptador d'aparicions: fixa l'ordre de dibuix de sprites i eixam
+            self.chunk_entities = {}  # tram -> [(sprite, grups propis)]
+
+        def ensure(self, col):
+            """Assegura que el nivell està construït fins a la columna 'col' (inclosa)"""
+            target = min(self.num_chunks, col // self.chunk_cols + 1)
+            while self.loaded < target:
+                self.load_tiles(self.loaded); self.loaded += 1
+            spawn_to = target if target == self.num_chunks else target - 1
+            while self.spawned < spawn_to:
+                self.spawn_entities(self.spawned); self.spawned += 1
+
+        def load_tiles(self, chunk):
+            c0 = chunk * self.chunk_cols; c1 = min(level.cols, c0 + self.chunk_cols)
+            column_tiles = level.column_range(c0, c1)
+            for r in range(level.rows):
+                used = [c for c in range(c0, c1) if column_tiles[(c - c0) * level.rows + r] != TILE_EMPTY]
+                if not used: continue
+                first = used[0]
+                strip = counted(pygame.Surface(((used[-1] + 1 - first) * TILE_SIZE, TILE_SIZE), pygame.SRCALPHA))
+                y = map_start_y + r * TILE_SIZE
+                for c in used:
+                    if column_tiles[(c - c0) * level.rows + r] == TILE_GROUND: p = Platform(c * TILE_SIZE, y, block_img, is_floating=False)
+                    else: p = Platform(c * TILE_SIZE, y, plat_img, is_floating=True)
+                    tiles.add(c, r, p)
+                    strip.blit(p.image, ((c - first) * TILE_SIZE, 0))
+                terrain_chunks.append((pygame.Rect(first * TILE_SIZE, y, strip.get_width(), TILE_SIZE), counted(strip.convert_alpha())))
+
+        def spawn_entities(self, chunk):
+            nonlocal player
+            entities = self.chunk_entities.get(chunk)
+            if entities is None:
+                entities = self.chunk_entities[chunk] = []
+                c0 = chunk * self.chunk_cols
+                for col, row, cell in level.entities_in(c0, c0 + self.chunk_cols):
+                    x = col * TILE_SIZE
+                    y = map_start_y + (row * TILE_SIZE)
+                    if cell == 'P':
+                        player = Player(x, y + TILE_SIZE); entities.append((player, ()))
+                    elif cell == 'G' and swarm is not None:
+                        entities.append((swarm.add(x, y + TILE_SIZE, x - 200, x + 200), None))
+                    elif cell == 'G':
+                        entities.append((Enemy(x, y + TILE_SIZE, x - 200, x + 200), (enemies,)))
+                    elif cell == 'R':
+                        entities.append((Gift(x + 20, y + 20), (gifts,)))
+                    elif cell == 'S':
+                        entities.append((Goal(x, y + TILE_SIZE), (goals,)))
+            else:
+                for sprite, groups in entities:
+                    if groups is not None: sprite.reset()
+            for sprite, groups in entities:
+                seq = self.spawn_seq; self.spawn_seq += 1
+                if groups is None: swarm.spawn(sprite, seq); continue  # 'sprite' és l'índex dins l'eixam
+                sprite.draw_seq = seq
+                for group in groups: group.add(sprite)
+                all_sprites.add(sprite)
+
+    stream = LevelStream()
     camera_y = 0 
-    
-    score = 0
-    total_gifts = len(gifts)
-    game_over = False; won = False
+    total_gifts = level.count('R')
+
+    class PlatformerSession:
+        """Estat d'una partida; reset() reaprofita el terreny construït i els sprites ja creats"""
+        def __init__(self):
+            self.reset()
+        def reset(self):
+            for group in (all_sprites, enemies, gifts, goals): group.empty()
+            if swarm is not None: swarm.clear()
+            stream.spawned = 0; stream.spawn_seq = 0
+            stream.ensure(WIDTH // TILE_SIZE + stream.chunk_cols)
+            # --- Càmera ---
+            self.camera_x = 0; self.prev_camera_x = 0
+            self.score = 0
+            self.game_over = False; self.won = False
+            self.ticker = FixedStep()
+        @property
+        def finished(self):
+            return self.game_over or self.won
+
+    game = PlatformerSession()
     
     while True:
-        keys = pygame.key.get_pressed()
-        for event in pygame.event.get():
+        keys = get_keys()
+        for event in get_events("platformer"):
             if event.type == pygame.QUIT: pygame.quit(); sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE: return
                 if event.key == pygame.K_SPACE:
-                    if not game_over and not won: player.jump()
-                    elif game_over or won: return run_platformer_game(character_name)
-
-        if not game_over and not won:
-            player.update(keys, blocks)
-            enemies.update(blocks)
-            
-            enemy_hits = pygame.sprite.spritecollide(player, enemies, False)
-            for enemy in enemy_hits:
-                if player.vel_y > 0 and player.rect.bottom < enemy.rect.centery + 40:
-                    enemy.kill(); player.vel_y = -12 
-                else: game_over = True
+                    if not game.finished: player.jump()
+                    else: game.reset()
+
+        for _ in range(game.ticker.advance()):
+            if game.finished: break
+            save_prev_pos(all_sprites); game.prev_camera_x = game.camera_x
+            player.update(keys, tiles)
+            if swarm is not None:
+                swarm.update(tiles)
+                for i in swarm.colliding(player.rect):
+                    if player.vel_y > 0 and player.rect.bottom < swarm.y[i] + swarm.h // 2 + 40:
+                        swarm.active[i] = False; player.vel_y = -12
+                    else: game.game_over = True
+            else:
+                enemies.update(tiles)
+                enemy_hits = pygame.sprite.spritecollide(player, enemies, False)
+                for enemy in enemy_hits:
+                    if player.vel_y > 0 and player.rect.bottom < enemy.rect.centery + 40:
+                        enemy.kill(); player.vel_y = -12 
+                    else: game.game_over = True
             
-            if pygame.sprite.spritecollide(player, gifts, True): score += 1
-            if pygame.sprite.spritecollide(player, goals, False) and score >= total_gifts: won = True
-            if player.rect.top > HEIGHT + 1000: game_over = True
+            if pygame.sprite.spritecollide(player, gifts, True): game.score += 1
+            if pygame.sprite.spritecollide(player, goals, False) and game.score >= total_gifts: game.won = True
+            if player.rect.top > HEIGHT + 1000: game.game_over = True
 
             target_cam_x = player.rect.centerx - WIDTH // 2
             target_cam_x = max(0, min(target_cam_x, level_width - WIDTH))
-            camera_x += (target_cam_x - camera_x) * 0.1
+            game.camera_x += (target_cam_x - game.camera_x) * 0.1
+            stream.ensure(int(max(game.camera_x + WIDTH, player.rect.right)) // TILE_SIZE + stream.chunk_cols)
+        alpha = 1 if game.finished else game.ticker.alpha
+        draw_cam_x = game.prev_camera_x + (game.camera_x - game.prev_camera_x) * alpha
 
+        mark_draw()
         if bg_img: screen.blit(bg_img, (0, 0))
         else: screen.fill((135, 206, 235))
         
+        view = pygame.Rect(int(draw_cam_x), int(camera_y), WIDTH, HEIGHT)
+        for chunk_rect, chunk in terrain_chunks:
+            if chunk_rect.colliderect(view): screen.blit(chunk, (chunk_rect.x - draw_cam_x, chunk_rect.y - camera_y))
+        # Els grinch de l'eixam s'intercalen amb els sprites en ordre d'aparició, com si fossin al grup
+        swarm_blits = swarm.visible(view, draw_cam_x, camera_y, alpha) if swarm is not None else []; k = 0
         for sprite in all_sprites:
-            y_offset = getattr(sprite, "visual_y_offset", 0)
-            screen.blit(sprite.image, (sprite.rect.x - camera_x, sprite.rect.y - camera_y - y_offset))
+            while k < len(swarm_blits) and swarm_blits[k][0] < sprite.draw_seq: screen.blit(*swarm_blits[k][1:]); k += 1
+            if view.colliderect((sprite.rect.x, sprite.rect.y, sprite.image.get_width(), sprite.image.get_height())):
+                x, y = interp_pos(sprite, alpha)
+                screen.blit(sprite.image, (x - draw_cam_x, y - camera_y))
+        for _, image, pos in swarm_blits[k:]: screen.blit(image, pos)
             
-        score_text = font_ui.render(f"Regals: {score} / {total_gifts}", True, BLACK)
+        score_text = render_text(font_ui, f"Regals: {game.score} / {total_gifts}", True, BLACK)
         draw_paper_box(screen, pygame.Rect(20, 20, 300, 60), score_text)
         
-        if game_over:
-            s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); s.fill((0,0,0,180)); screen.blit(s, (0,0))
+        if game.game_over:
+            screen.blit(translucent((WIDTH, HEIGHT), (0,0,0,180)), (0,0))
             
-            txt_surf = font_big.render("OH NO! T'HAN ATRAPAT!", True, PAPER_COLOR)
+            txt_surf = render_text(font_big, "OH NO! T'HAN ATRAPAT!", True, PAPER_COLOR)
             txt_rect = txt_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
             screen.blit(txt_surf, txt_rect)
             
-            sub_surf = font_ui.render("Espai per reiniciar", True, WHITE)
+            sub_surf = render_text(font_ui, "Espai per reiniciar", True, WHITE)
             sub_rect = sub_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
             screen.blit(sub_surf, sub_rect)
 
-        if won:
-            s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); s.fill((0,0,0,180)); screen.blit(s, (0,0))
+        if game.won:
+            screen.blit(translucent((WIDTH, HEIGHT), (0,0,0,180)), (0,0))
             
-            txt_surf = font_big.render("GRÀCIES PER L'AJUDA!", True, GOLD)
+            txt_surf = render_text(font_big, "GRÀCIES PER L'AJUDA!", True, GOLD)
             txt_rect = txt_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
             screen.blit(txt_surf, txt_rect)
             
-            sub_surf = font_ui.render("Has salvat el Nadal!", True, WHITE)
+            sub_surf = render_text(font_ui, "Has salvat el Nadal!", True, WHITE)
             sub_rect = sub_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
             screen.blit(sub_surf, sub_rect)
 
-        pygame.display.flip(); clock.tick(FPS)
+        end_frame()
 
 # ==============================================================================
 # JOC 5: RITME DE NADAL (Taiko Style - Custom Beat Map)
 # ==============================================================================
 
+# --- CONFIGURACIÓ DEL MAPA DE RITME (BEAT MAP) ---
+BEAT_MAP = [
+    4000, 4520, 5040,
+    8100, 8620, 9140,
+    10650, 11600, 12600, 13050,
+    14100, 15100, 16100,
+    17500, 18020, 18540
+]
+SONG_END_MS = 18800
+RHYTHM_CONFIG_FILE = "config_ritme.json"
+CHART_DIR = "ritmes"
+CHART_VERSION = 1
+WIN_SCORE_RATIO = 0.625  # 1000 punts dels 1600 possibles amb el BEAT_MAP original
+# ----------------------------------------------------
+
+def find_rhythm_song():
+    for path in ("nadal_song.mp3", "nadal_song.wav"):
+        if os.path.exists(path): return path
+    return None
+
+def load_rhythm_song():
+    """Carrega la cançó al mixer; retorna si s'ha pogut carregar"""
+    try:
+        path = find_rhythm_song()
+        if path and init_mixer():
+            pygame.mixer.music.load(path)
+            return True
+    except:
+        print("Error carregant música.")
+    return False
+
+def chart_path(song_hash):
+    return os.path.join(CHART_DIR, f"{song_hash}.json")
+
+def load_beat_chart(song_path):
+    """
+    Retorna (beats, end_ms) del chart generat per a aquest fitxer d'àudio,
+    o el BEAT_MAP manual si no n'hi ha cap (o és d'una versió antiga).
+    """
+    if song_path:
+        try:
+            with open(chart_path(file_hash(song_path)), encoding="utf-8") as f:
+                chart = json.load(f)
+            if chart.get("version") == CHART_VERSION and chart.get("beats"):
+                return chart["beats"], chart["end_ms"]
+        except (OSError, ValueError, KeyError):
+            pass
+    return BEAT_MAP, SONG_END_MS
+
+def load_rhythm_latency():
+    """Retard àudio/entrada mesurat amb el calibratge (ms), o 0 si no n'hi ha"""
+    try:
+        with open(RHYTHM_CONFIG_FILE, encoding="utf-8") as f:
+            return float(json.load(f).get("latency_ms", 0))
+    except (OSError, ValueError):
+        return 0.0
+
+def save_rhythm_latency(latency_ms):
+    with open(RHYTHM_CONFIG_FILE, "w", encoding="utf-8") as f:
+        json.dump({"latency_ms": round(latency_ms, 1)}, f)
+
+class NoteQueue:
+    """
+    Notes del joc de ritme en arrays compactes ordenats per hit_time.
+    Les notes visibles són un deque d'índexs en ordre temporal: les noves entren per la dreta
+    i les que ja han sortit de pantalla es retiren per l'esquerra.
+    """
+    PENDING = 0; HIT = 1; MISSED = 2
+
+    def __init__(self, hit_times):
+        self.times = array("d", sorted(hit_times))
+        self.state = bytearray(len(self.times))
+        self.visible = deque()
+        self.reset()
+
+    def reset(self):
+        """Torna totes les notes a pendents, sense tornar a crear els arrays"""
+        self.state[:] = bytes(len(self.times))
+        self.visible.clear()
+        self.spawned = 0      # notes [0, spawned) ja han aparegut
+        self.miss_cursor = 0  # notes [0, miss_cursor) ja no es poden encertar
+
+    def spawn_until(self, t):
+        while self.spawned < len(self.times) and self.times[self.spawned] <= t:
+            self.visible.append(self.spawned); self.spawned += 1
+
+    def retire_before(self, t):
+        while self.visible and self.times[self.visible[0]] < t: self.visible.popleft()
+
+    def expire_before(self, t):
+        """Marca com a fallades les notes pendents anteriors a 't'; retorna quantes"""
+        missed = 0
+        while self.miss_cursor < self.spawned and self.times[self.miss_cursor] < t:
+            if self.state[self.miss_cursor] == self.PENDING:
+                self.state[self.miss_cursor] = self.MISSED; missed += 1
+            self.miss_cursor += 1
+        return missed
+
+    def judge(self, t, window):
+        """Índex de la nota pendent més propera a 't' a menys de 'window' ms, o None"""
+        i = bisect.bisect_left(self.times, t - window, self.miss_cursor, self.spawned)
+        best = None; best_dt = window
+        while i < self.spawned and self.times[i] < t + window:
+            dt = abs(self.times[i] - t)
+            if self.state[i] == self.PENDING and dt < best_dt: best = i; best_dt = dt
+            i += 1
+        return best
+
+class SongClock:
+    """
+    Temps de la cançó en ms. Avança amb el rellotge de paret (suau) i es corregeix poc a poc
+    cap a la posició real de l'àudio (pygame.mixer.music.get_pos()), que és més grollera però
+    no es desvia. Mai va enrere.
+    """
+    DRIFT_GAIN = 0.1
+
+    def __init__(self, use_audio):
+        self.use_audio = use_audio
+        self.start = time.perf_counter()
+        self.offset = 0.0
+        self.last_audio_pos = None
+        self.sim_time = 0.0
+        self.time = 0.0
+
+    def tick(self):
+        """S'ha de cridar un cop per frame; retorna el temps de cançó actual"""
+        if song_time_override is not None:
+            self.time = song_time_override
+            return self.time
+        if sim_frame_ms is not None and not recording():
+            self.sim_time += sim_frame_ms; wall = self.sim_time
+        else:
+            wall = (time.perf_counter() - self.start) * 1000
+            if self.use_audio:
+                pos = pygame.mixer.music.get_pos()
+                # get_pos() només canvia quan el mixer consumeix un buffer: corregim en aquests moments
+                if pos >= 0 and pos != self.last_audio_pos:
+                    self.last_audio_pos = pos
+                    self.offset += (pos - (wall + self.offset)) * self.DRIFT_GAIN
+        self.time = max(self.time, wall + self.offset)
+        if recording(): self.time = input_recorder.record_song_time(self.time)
+        return self.time
+
+def run_rhythm_calibration():
+    """
+    Calibratge de latència: sona la cançó i el jugador prem ESPAI a cada cop del mapa de ritme.
+    La mediana de la diferència entre pulsació i cop es desa com a retard àudio/entrada.
+    """
+    song_loaded = load_rhythm_song()
+    beats, _ = load_beat_chart(find_rhythm_song())
+    if song_loaded: pygame.mixer.music.play()
+    song_clock = SongClock(song_loaded)
+    samples = []
+    while True:
+        song_time = song_clock.tick()
+        for event in get_events("calibration"):
+            if event.type == pygame.QUIT: pygame.quit(); sys.exit()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    if song_loaded: pygame.mixer.music.stop()
+                    return
+                if event.key == pygame.K_SPACE:
+                    i = bisect.bisect_left(beats, song_time)
+                    nearest = min(beats[max(0, i-1):i+1], key=lambda b: abs(b - song_time))
+                    if abs(song_time - nearest) < 300: samples.append(song_time - nearest)
+        if song_time > beats[-1] + 1000: break
+
+        mark_draw()
+        screen.fill((30, 30, 50))
+        txt = render_text(font_title, "CALIBRATGE", True, PAPER_COLOR); screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT*0.3)))
+        sub = render_text(font_ui, "Prem ESPAI a cada cop de la música", True, WHITE); screen.blit(sub, sub.get_rect(center=(WIDTH//2, HEIGHT*0.5)))
+        cnt = render_text(font_ui, f"Cops: {len(samples)}", True, GOLD); screen.blit(cnt, cnt.get_rect(center=(WIDTH//2, HEIGHT*0.6)))
+        end_frame()
+
+    if song_loaded: pygame.mixer.music.stop()
+    if len(samples) >= 4:
+        samples.sort()
+        save_rhythm_latency(samples[len(samples) // 2])
+
 def run_rhythm_game(character_name):
-    # --- CONFIGURACIÓ DEL MAPA DE RITME (BEAT MAP) ---
-    BEAT_MAP = [
-        4000, 4520, 5040,
-        8100, 8620, 9140,
-        10650, 11600, 12600, 13050,
-        14100, 15100, 16100,
-        17500, 18020, 18540
-    ]
-    # ----------------------------------------------------
-    
     bg_img = None
     if os.path.exists("fons_musica.png"):
-        bg_img = pygame.transform.smoothscale(pygame.image.load("fons_musica.png").convert(), (WIDTH, HEIGHT))
+        bg_img = load_image("fons_musica.png", (WIDTH, HEIGHT), alpha=False)
         
     HIT_ZONE_COLOR = (200, 200, 200)
     
-    song_loaded = False
-    try:
-        if os.path.exists("nadal_song.mp3"):
-            pygame.mixer.music.load("nadal_song.mp3")
-            song_loaded = True
-        elif os.path.exists("nadal_song.wav"):
-            pygame.mixer.music.load("nadal_song.wav")
-            song_loaded = True
-    except:
-        print("Error carregant música.")
+    song_loaded = load_rhythm_song()
+    beats, song_end_ms = load_beat_chart(find_rhythm_song())
 
     # --- Elements del Joc ---
     NOTE_Y = int(HEIGHT * 0.5)
@@ -681,158 +2171,191 @@ def run_rhythm_game(character_name):
     
     SPAWN_X = WIDTH + 50
     travel_dist = SPAWN_X - HIT_X
-    travel_time_ms = (travel_dist / NOTE_SPEED) * (1000 / FPS)
-    
-    active_notes = [] 
-    score = 0
-    combo = 0
-    max_combo = 0
-    
-    current_note_index = 0
-    start_time = 0
-    music_started = False
-    
-    feedback_text = ""
-    feedback_timer = 0
-    feedback_color = WHITE
-    hit_effect_timer = 0 
-    
-    game_finished = False
-    won = False
+    # La velocitat de disseny era NOTE_SPEED px per frame a 60 FPS; aquí es passa a px/ms
+    px_per_ms = NOTE_SPEED * FPS / 1000
+    travel_time_ms = travel_dist / px_per_ms
+    PERFECT_MS = HIT_RADIUS * 0.5 / px_per_ms
+    GOOD_MS = HIT_RADIUS * 1.2 / px_per_ms
+    MISS_MS = HIT_RADIUS * 2 / px_per_ms
+    GONE_MS = (HIT_X + 100) / px_per_ms
     
+    notes = NoteQueue(beats)
     note_img = load_christmas_ball(NOTE_RADIUS * 2)
+
+    class RhythmSession:
+        """Estat d'una partida; reset() torna a començar la cançó amb el mateix chart i imatges"""
+        def __init__(self):
+            self.reset()
+        def reset(self):
+            notes.reset()
+            self.latency_ms = load_rhythm_latency()  # pot haver canviat després de calibrar
+            self.score = 0
+            self.combo = 0
+            self.max_combo = 0
+            self.song_clock = None
+            self.feedback_text = ""
+            self.feedback_timer = 0
+            self.feedback_color = WHITE
+            self.hit_effect_timer = 0 
+            self.game_finished = False
+            self.won = False
+
+    game = RhythmSession()
     
     running = True
     while running:
-        current_ticks = pygame.time.get_ticks()
-        
-        if not music_started:
+        if game.song_clock is None:
             if song_loaded: pygame.mixer.music.play()
-            start_time = current_ticks
-            music_started = True
+            game.song_clock = SongClock(song_loaded)
             
-        song_time = current_ticks - start_time
+        song_time = game.song_clock.tick()
+        current_ticks = song_time  # els efectes visuals van amb el temps de la cançó (reproduïble amb --replay)
+        # Les pulsacions arriben 'latency_ms' tard respecte a l'àudio que sent el jugador
+        input_time = song_time - game.latency_ms
         
-        if song_time >= 18800 and not game_finished:
+        if song_time >= song_end_ms and not game.game_finished:
             if song_loaded: pygame.mixer.music.stop()
-            game_finished = True
-            won = (score >= 1000)
+            game.game_finished = True
+            game.won = (game.score >= len(beats) * 100 * WIN_SCORE_RATIO)
         
-        if not game_finished and current_note_index < len(BEAT_MAP):
-            next_beat_time = BEAT_MAP[current_note_index]
-            if song_time >= next_beat_time - travel_time_ms:
-                active_notes.append({'x': float(SPAWN_X), 'hit_time': next_beat_time, 'active': True})
-                current_note_index += 1
+        if not game.game_finished: notes.spawn_until(song_time + travel_time_ms)
         
-        for event in pygame.event.get():
+        for event in get_events("rhythm"):
             if event.type == pygame.QUIT:
                 pygame.quit(); sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     if song_loaded: pygame.mixer.music.stop()
                     return
-                if game_finished and not won and event.key == pygame.K_SPACE:
-                    return run_rhythm_game(character_name)
+                if event.key == pygame.K_c:
+                    if song_loaded: pygame.mixer.music.stop()
+                    run_rhythm_calibration()
+                    game.reset()
+                    break
+                if game.game_finished and not game.won and event.key == pygame.K_SPACE:
+                    game.reset()
+                    break
                 
-                if not game_finished and event.key == pygame.K_SPACE:
-                    hit_effect_timer = current_ticks + 100
-                    hit_made = False
-                    for note in active_notes:
-                        if note['active']:
-                            dist = abs(note['x'] - HIT_X)
-                            if dist < HIT_RADIUS * 0.5:
-                                score += 100; combo += 1
-                                feedback_text = "PERFECTE!"; feedback_color = GOLD
-                                feedback_timer = current_ticks + 500
-                                note['active'] = False; hit_made = True; break
-                            elif dist < HIT_RADIUS * 1.2:
-                                score += 50; combo += 1
-                                feedback_text = "BÉ!"; feedback_color = CHRISTMAS_GREEN
-                                feedback_timer = current_ticks + 500
-                                note['active'] = False; hit_made = True; break
-                    if not hit_made: combo = 0 
-
-        if not game_finished:
-            for note in active_notes:
-                note['x'] -= NOTE_SPEED
-                if note['x'] < HIT_X - HIT_RADIUS * 2 and note['active']:
-                    note['active'] = False
-                    combo = 0
-                    feedback_text = "MISS..."; feedback_color = (150, 150, 150)
-                    feedback_timer = current_ticks + 500
-
-            active_notes = [n for n in active_notes if n['x'] > -100]
-            if combo > max_combo: max_combo = combo
-
+                if not game.game_finished and event.key == pygame.K_SPACE:
+                    game.hit_effect_timer = current_ticks + 100
+                    i = notes.judge(input_time, GOOD_MS)
+                    if i is None: game.combo = 0
+                    else:
+                        notes.state[i] = NoteQueue.HIT; game.combo += 1
+                        game.feedback_timer = current_ticks + 500
+                        if abs(notes.times[i] - input_time) < PERFECT_MS:
+                            game.score += 100; game.feedback_text = "PERFECTE!"; game.feedback_color = GOLD
+                        else:
+                            game.score += 50; game.feedback_text = "BÉ!"; game.feedback_color = CHRISTMAS_GREEN
+        # Després d'un reinici (song_clock és None) el frame es dibuixa igualment amb l'estat nou i
+        # passa per end_frame(); la cançó torna a sonar al frame següent
+
+        if not game.game_finished:
+            if notes.expire_before(input_time - MISS_MS):
+                game.combo = 0
+                game.feedback_text = "MISS..."; game.feedback_color = (150, 150, 150)
+                game.feedback_timer = current_ticks + 500
+
+            notes.retire_before(song_time - GONE_MS)
+            if game.combo > game.max_combo: game.max_combo = game.combo
+
+        mark_draw()
         if bg_img: screen.blit(bg_img, (0,0))
         else: screen.fill((30, 30, 50))
         
         # Carril
         lane_rect = pygame.Rect(0, NOTE_Y - HIT_RADIUS - 10, WIDTH, HIT_RADIUS * 2 + 20)
-        s = pygame.Surface((WIDTH, lane_rect.height), pygame.SRCALPHA)
-        s.fill((0, 0, 0, 100))
-        screen.blit(s, (0, lane_rect.y))
+        screen.blit(translucent((WIDTH, lane_rect.height), (0, 0, 0, 100)), (0, lane_rect.y))
         
         # Fons Tambor (Sense límit)
-        s_drum = pygame.Surface((HIT_RADIUS*2, HIT_RADIUS*2), pygame.SRCALPHA)
-        pygame.draw.circle(s_drum, (0, 0, 0, 150), (HIT_RADIUS, HIT_RADIUS), HIT_RADIUS)
-        screen.blit(s_drum, (HIT_X - HIT_RADIUS, NOTE_Y - HIT_RADIUS))
+        screen.blit(translucent((HIT_RADIUS*2, HIT_RADIUS*2), (0, 0, 0, 150), "circle"), (HIT_X - HIT_RADIUS, NOTE_Y - HIT_RADIUS))
 
         # Tambor Flash (Sense límit)
-        if current_ticks < hit_effect_timer:
+        if current_ticks < game.hit_effect_timer:
              pygame.draw.circle(screen, (255, 255, 200), (HIT_X, NOTE_Y), HIT_RADIUS)
 
-        for note in active_notes:
-            if note['active']:
-                r = note_img.get_rect(center=(int(note['x']), NOTE_Y))
-                screen.blit(note_img, r)
+        half_note = note_img.get_width() // 2
+        for i in notes.visible:
+            if notes.state[i] == NoteQueue.PENDING:
+                note_x = HIT_X + (notes.times[i] - song_time) * px_per_ms
+                screen.blit(note_img, (int(note_x) - half_note, NOTE_Y - half_note))
 
         ui_rect = pygame.Rect(20, 20, 300, 120)
         draw_paper_box(screen, ui_rect)
-        screen.blit(font_ui.render(f"Punts: {score}", True, TEXT_COLOR), (40, 35))
-        screen.blit(font_ui.render(f"Combo: {combo}", True, CHRISTMAS_RED), (40, 80))
+        screen.blit(render_text(font_ui, f"Punts: {game.score}", True, TEXT_COLOR), (40, 35))
+        screen.blit(render_text(font_ui, f"Combo: {game.combo}", True, CHRISTMAS_RED), (40, 80))
         
-        if current_ticks < feedback_timer:
-            fb_surf = font_ui.render(feedback_text, True, feedback_color)
+        if current_ticks < game.feedback_timer:
+            fb_surf = render_text(font_ui, game.feedback_text, True, game.feedback_color)
             fb_w = fb_surf.get_width() + 40
             fb_h = 60
             fb_rect = pygame.Rect(0, 0, fb_w, fb_h)
             fb_rect.center = (HIT_X, NOTE_Y - 150)
             draw_paper_box(screen, fb_rect, fb_surf)
 
-        if game_finished:
-            s = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); s.fill((0,0,0,180)); screen.blit(s, (0,0))
-            if won:
-                txt_surf = font_big.render("MOLT BÉ!!!", True, GOLD)
+        if game.game_finished:
+            screen.blit(translucent((WIDTH, HEIGHT), (0,0,0,180)), (0,0))
+            if game.won:
+                txt_surf = render_text(font_big, "MOLT BÉ!!!", True, GOLD)
                 txt_rect = txt_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
                 screen.blit(txt_surf, txt_rect)
                 
-                sub_surf = font_ui.render("Pots obrir el següent regal", True, WHITE)
+                sub_surf = render_text(font_ui, "Pots obrir el següent regal", True, WHITE)
                 sub_rect = sub_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
                 screen.blit(sub_surf, sub_rect)
             else:
-                txt_surf = font_big.render("TORNA-HO A PROVAR!", True, CHRISTMAS_RED)
+                txt_surf = render_text(font_big, "TORNA-HO A PROVAR!", True, CHRISTMAS_RED)
                 txt_rect = txt_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
                 screen.blit(txt_surf, txt_rect)
                 
-                sub_surf = font_ui.render("Prem ESPAI per reiniciar", True, WHITE)
+                sub_surf = render_text(font_ui, "Prem ESPAI per reiniciar", True, WHITE)
                 sub_rect = sub_surf.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
                 screen.blit(sub_surf, sub_rect)
         else:
-            txt_inst = font_ui.render("Prem ESPAI al ritme!", True, WHITE)
+            txt_inst = render_text(font_ui, "Prem ESPAI al ritme!  |  C: Calibrar", True, WHITE)
             screen.blit(txt_inst, txt_inst.get_rect(center=(WIDTH//2, HEIGHT - 50)))
 
-        pygame.display.flip()
-        clock.tick(FPS)
+        end_frame()
 
 
 # ==============================================================================
 # HUB DE JOCS (Menú Selecció - 5 JOCS)
 # ==============================================================================
 
+def game_asset_requests(character_name=None):
+    """
+    Imatges que demanen els minijocs a la resolució actual, per precarregar-les des dels menús.
+    Han de coincidir amb les crides a load_image() de cada joc; les que depenen d'una altra imatge
+    (tio_cop.png) es precarreguen sense escalar. Sense personatge, només les comunes.
+    """
+    full = (WIDTH, HEIGHT)
+    requests = []
+    if character_name:
+        face = f"cara_{character_name}.png"
+        requests += [(face, size, False, True) for size in (100, int(HEIGHT * 0.25), 80, 140)]
+    requests += [
+        ("fondo_fuji.png", full, False, False), ("tori.png", int(HEIGHT * 0.45), False, True), ("daruma.png", int(HEIGHT * 0.19), False, True),
+        ("fons_tio.png", full, False, False), ("tio.png", int(HEIGHT * 0.35), True, True), ("tio_cop.png", None, False, True),
+        ("pal.png", (60, int(HEIGHT * 0.9)), False, True),
+        ("fons_cuina.png", full, False, False),
+        ("fons_neu.png", full, False, True), ("bloc_terra.png", (80, 80), False, True), ("bloc_plataforma.png", (80, 80), False, True),
+        ("regal.png", (70, 70), False, True), ("papa_noel.png", (200, 200), False, True), ("grinch.png", (100, 100), False, True),
+        ("fons_musica.png", full, False, False), ("bola_nadal.png", (int(HEIGHT * 0.06) * 2,) * 2, False, True),
+    ]
+    return requests
+
+def play_game(game, character_name):
+    """Executa un minijoc; amb --record, com una sessió gravada"""
+    if input_recorder: input_recorder.start(game.__name__, character_name)
+    try:
+        game(character_name)
+    finally:
+        if input_recorder: input_recorder.stop()
+
 def game_hub(character_name):
     img_player = load_face(character_name, 100)
-    title_text = font_title.render("JOC DE NADAL DE FAMÍLIA", True, PAPER_COLOR)
+    asset_preloader.request(game_asset_requests(character_name))
+    title_text = render_text(font_title, "JOC DE NADAL DE FAMÍLIA", True, PAPER_COLOR)
     
     # Disseny: 3 Dalt, 2 Avall
     btn_w = int(WIDTH * 0.22) # Una mica més estrets per cabre-hi 3
@@ -855,42 +2378,53 @@ def game_hub(character_name):
     
     rect_back = pygame.Rect(WIDTH*0.35, HEIGHT*0.8, WIDTH*0.3, 60)
 
+    def build_background():
+        layer = counted(pygame.Surface((WIDTH, HEIGHT)))
+        if os.path.exists("fondo_fuji.png"):
+            layer.blit(load_image("fondo_fuji.png", (WIDTH, HEIGHT), alpha=False), (0,0))
+            overlay = counted(pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)); overlay.fill((0,0,0,150))
+            layer.blit(overlay, (0,0))
+        else: layer.fill((50, 20, 20))
+        layer.blit(title_text, title_text.get_rect(center=(WIDTH//2, HEIGHT*0.15)))
+        layer.blit(img_player, (20, 20))
+        layer.blit(render_text(font_ui, f"Jugador: {character_name.capitalize()}", True, WHITE), (140, 50))
+        return layer
+
+    buttons = [
+        (rect_g1, "RECORDS\nDE JAPÓ", run_japan_game),
+        (rect_g2, "EL CAGA TIÓ", run_tio_game),
+        (rect_g3, "SOPA DE\nLLETRES", run_soup_game),
+        (rect_g4, "AVENTURA\nREGALS", run_platformer_game),
+        (rect_g5, "RITME\nDE NADAL", run_rhythm_game),
+    ]
+    dirty = DirtyRects() if dirty_rects_mode else None
+
     hub_running = True
     while hub_running:
-        mouse_pos = pygame.mouse.get_pos()
-        for event in pygame.event.get():
+        mouse_pos = get_mouse_pos()
+        for event in get_events("hub"):
             if event.type == pygame.QUIT: return "EXIT"
             if event.type == pygame.MOUSEBUTTONDOWN:
-                if rect_g1.collidepoint(mouse_pos): run_japan_game(character_name)
-                elif rect_g2.collidepoint(mouse_pos): run_tio_game(character_name)
-                elif rect_g3.collidepoint(mouse_pos): run_soup_game(character_name)
-                elif rect_g4.collidepoint(mouse_pos): run_platformer_game(character_name)
-                elif rect_g5.collidepoint(mouse_pos): run_rhythm_game(character_name)
-                elif rect_back.collidepoint(mouse_pos): return "BACK" 
-
-        if os.path.exists("fondo_fuji.png"): 
-             bg = pygame.transform.smoothscale(pygame.image.load("fondo_fuji.png").convert(), (WIDTH, HEIGHT))
-             screen.blit(bg, (0,0))
-             overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA); overlay.fill((0,0,0,150))
-             screen.blit(overlay, (0,0))
-        else: screen.fill((50, 20, 20))
-
-        t_rect = title_text.get_rect(center=(WIDTH//2, HEIGHT*0.15))
-        screen.blit(title_text, t_rect)
-        screen.blit(img_player, (20, 20))
-        name_txt = font_ui.render(f"Jugador: {character_name.capitalize()}", True, WHITE)
-        screen.blit(name_txt, (140, 50))
-        
-        draw_paper_box(screen, rect_g1, render_multiline_text("RECORDS\nDE JAPÓ", font_ui, TEXT_COLOR), None, rect_g1.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_g2, render_multiline_text("EL CAGA TIÓ", font_ui, TEXT_COLOR), None, rect_g2.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_g3, render_multiline_text("SOPA DE\nLLETRES", font_ui, TEXT_COLOR), None, rect_g3.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_g4, render_multiline_text("AVENTURA\nREGALS", font_ui, TEXT_COLOR), None, rect_g4.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_g5, render_multiline_text("RITME\nDE NADAL", font_ui, TEXT_COLOR), None, rect_g5.collidepoint(mouse_pos))
-        
-        draw_paper_box(screen, rect_back, font_ui.render("CANVIAR PERSONATGE", True, TEXT_COLOR), None, rect_back.collidepoint(mouse_pos))
-
-        pygame.display.flip()
-        clock.tick(FPS)
+                for rect, _, game in buttons:
+                    if rect.collidepoint(mouse_pos):
+                        asset_preloader.pump(None)
+                        play_game(game, character_name)
+                        if dirty: dirty.invalidate()
+                        break
+                else:
+                    if rect_back.collidepoint(mouse_pos): return "BACK" 
+
+        def draw():
+            screen.blit(get_static_layer("hub", build_background, character_name), (0,0))
+            for rect, label, _ in buttons:
+                draw_paper_box(screen, rect, render_multiline_text(label, font_ui, TEXT_COLOR), None, rect.collidepoint(mouse_pos))
+            draw_paper_box(screen, rect_back, render_text(font_ui, "CANVIAR PERSONATGE", True, TEXT_COLOR), None, rect_back.collidepoint(mouse_pos))
+
+        if dirty:
+            for rect, label, _ in buttons: dirty.track(label, rect, rect.collidepoint(mouse_pos))
+            dirty.track("back", rect_back, rect_back.collidepoint(mouse_pos))
+        render_scene(dirty, draw)
+        asset_preloader.pump()
 
 
 # ==============================================================================
@@ -905,7 +2439,8 @@ def char_select_screen():
     img_esther = load_face("esther", face_size)
     img_arnau = load_face("arnau", face_size)
     
-    title = font_big.render("QUI ETS?", True, PAPER_COLOR)
+    title = render_text(font_big, "QUI ETS?", True, PAPER_COLOR)
+    asset_preloader.request(game_asset_requests())
     
     btn_w = int(WIDTH * 0.2)
     btn_h = int(HEIGHT * 0.3)
@@ -924,34 +2459,428 @@ def char_select_screen():
     
     rect_quit = pygame.Rect(WIDTH - 220, HEIGHT - 80, 200, 60)
     
+    def build_background():
+        layer = counted(pygame.Surface((WIDTH, HEIGHT)))
+        layer.fill((30, 30, 50))
+        layer.blit(title, title.get_rect(center=(WIDTH//2, HEIGHT*0.12)))
+        return layer
+
+    choices = [
+        (rect_marti, "MARTÍ", img_marti, "marti"),
+        (rect_marta, "MARTA", img_marta, "marta"),
+        (rect_josepm, "JOSEP M", img_josepm, "josepm"),
+        (rect_esther, "ESTHER", img_esther, "esther"),
+        (rect_arnau, "ARNAU", img_arnau, "arnau"),
+    ]
+    dirty = DirtyRects() if dirty_rects_mode else None
+
     while True:
-        mouse_pos = pygame.mouse.get_pos()
-        for event in pygame.event.get():
+        mouse_pos = get_mouse_pos()
+        for event in get_events("char_select"):
             if event.type == pygame.QUIT: return None
             if event.type == pygame.MOUSEBUTTONDOWN:
-                if rect_marti.collidepoint(mouse_pos): return "marti"
-                if rect_marta.collidepoint(mouse_pos): return "marta"
-                if rect_josepm.collidepoint(mouse_pos): return "josepm"
-                if rect_esther.collidepoint(mouse_pos): return "esther"
-                if rect_arnau.collidepoint(mouse_pos): return "arnau"
+                for rect, _, _, name in choices:
+                    if rect.collidepoint(mouse_pos): return name
                 if rect_quit.collidepoint(mouse_pos): return None
         
-        screen.fill((30, 30, 50)) 
-        t_rect = title.get_rect(center=(WIDTH//2, HEIGHT*0.12))
-        screen.blit(title, t_rect)
-        
-        draw_paper_box(screen, rect_marti, font_ui.render("MARTÍ", True, TEXT_COLOR), img_marti, rect_marti.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_marta, font_ui.render("MARTA", True, TEXT_COLOR), img_marta, rect_marta.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_josepm, font_ui.render("JOSEP M", True, TEXT_COLOR), img_josepm, rect_josepm.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_esther, font_ui.render("ESTHER", True, TEXT_COLOR), img_esther, rect_esther.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_arnau, font_ui.render("ARNAU", True, TEXT_COLOR), img_arnau, rect_arnau.collidepoint(mouse_pos))
-        draw_paper_box(screen, rect_quit, font_ui.render("SORTIR", True, TEXT_COLOR), None, rect_quit.collidepoint(mouse_pos))
-        
-        pygame.display.flip()
-        clock.tick(FPS)
+        def draw():
+            screen.blit(get_static_layer("char_select", build_background), (0,0))
+            for rect, label, img, _ in choices:
+                draw_paper_box(screen, rect, render_text(font_ui, label, True, TEXT_COLOR), img, rect.collidepoint(mouse_pos))
+            draw_paper_box(screen, rect_quit, render_text(font_ui, "SORTIR", True, TEXT_COLOR), None, rect_quit.collidepoint(mouse_pos))
+
+        if dirty:
+            for rect, _, _, name in choices: dirty.track(name, rect, rect.collidepoint(mouse_pos))
+            dirty.track("quit", rect_quit, rect_quit.collidepoint(mouse_pos))
+        render_scene(dirty, draw)
+        asset_preloader.pump()
+
+# ==============================================================================
+# EXTRACCIÓ DEL MAPA DE RITME (python videojoc_nadal.py --beatmap)
+# ==============================================================================
+
+def detect_onsets(samples, rate, win=2048, hop=512, delta=0.08, min_gap_ms=200):
+    """
+    Detecció d'atacs per flux espectral, vectoritzada amb NumPy.
+    Retorna els temps (ms) dels pics del flux que superen la seva mitjana local en 'delta'.
+    """
+    x = samples.astype(np.float32)
+    if x.ndim == 2: x = x.mean(axis=1)
+    peak = np.abs(x).max()
+    if peak > 0: x /= peak
+    if len(x) < win: return []
+    frames = np.lib.stride_tricks.sliding_window_view(x, win)[::hop]
+    spectrum = np.log1p(100 * np.abs(np.fft.rfft(frames * np.hanning(win).astype(np.float32), axis=1)))
+    flux = np.concatenate(([0.0], np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)))
+    if flux.max() > 0: flux /= flux.max()
+
+    k = 2 * int(0.15 * rate / hop) + 1
+    local_mean = np.convolve(flux, np.ones(k) / k, mode="same")
+    is_peak = (flux > local_mean + delta) & (flux >= np.roll(flux, 1)) & (flux > np.roll(flux, -1))
+    times = np.nonzero(is_peak)[0] * hop * 1000.0 / rate
+
+    onsets = []
+    for t in times:
+        if not onsets or t - onsets[-1] >= min_gap_ms: onsets.append(t)
+    return onsets
+
+def build_beat_chart(song_path, start_ms=0, end_ms=None):
+    """Descodifica la cançó, en detecta els cops i desa el chart a CHART_DIR; retorna la ruta"""
+    if np is None: raise RuntimeError("Cal NumPy per extreure el mapa de ritme")
+    if not init_mixer(): raise RuntimeError("No s'ha pogut obrir el mixer d'àudio")
+    rate = pygame.mixer.get_init()[0]
+    samples = pygame.sndarray.array(pygame.mixer.Sound(song_path))
+    length_ms = len(samples) * 1000 / rate
+    last_ms = min(end_ms or length_ms, length_ms)
+    beats = [int(round(t)) for t in detect_onsets(samples, rate) if start_ms <= t <= last_ms]
+    # Amb --end explícit la partida acaba just allà; si no, poc després de l'últim cop
+    if end_ms is None: last_ms = min(length_ms, (beats[-1] + 260) if beats else length_ms)
+    song_hash = file_hash(song_path)
+    chart = {
+        "version": CHART_VERSION,
+        "audio": os.path.basename(song_path),
+        "sha1": song_hash,
+        "beats": beats,
+        "end_ms": int(last_ms),
+    }
+    os.makedirs(CHART_DIR, exist_ok=True)
+    with open(chart_path(song_hash), "w", encoding="utf-8") as f:
+        json.dump(chart, f, indent=1)
+    return chart_path(song_hash)
+
+def parse_beatmap_args(argv):
+    parser = argparse.ArgumentParser(description="Genera el mapa de ritme d'una cançó")
+    parser.add_argument("--beatmap", action="store_true")
+    parser.add_argument("--song", default=None, help="fitxer d'àudio (per defecte la cançó del joc)")
+    parser.add_argument("--start", type=int, default=0, help="ms a partir dels quals hi ha notes")
+    parser.add_argument("--end", type=int, default=None, help="ms on acaba la partida")
+    args = parser.parse_args(argv)
+    song = args.song or find_rhythm_song()
+    if not song: parser.error("no s'ha trobat cap cançó")
+    return song, args.start, args.end
+
+# ==============================================================================
+# PREPROCÉS D'IMATGES (python videojoc_nadal.py --preprocess --res WxH)
+# ==============================================================================
+
+CHARACTERS = ["marti", "marta", "josepm", "esther", "arnau"]
+
+def collect_asset_requests():
+    """Obre cada pantalla i cada joc un parell de frames (amb cada personatge) i apunta les imatges que demanen"""
+    global asset_requests, frame_hook
+    asset_requests = set()
+    try:
+        frame_hook = lambda: pygame.event.post(pygame.event.Event(pygame.QUIT))
+        char_select_screen(); game_hub(CHARACTERS[0])
+        frame_hook = None
+        for name in CHARACTERS:
+            for game in BENCH_GAMES:
+                if game != "rhythm": bench_game(game, 2, name)
+        bench_game("rhythm", 2)
+        return asset_requests
+    finally:
+        asset_requests = None; frame_hook = None
+        pygame.event.clear()
+
+def preprocess_assets(size):
+    """Escriu les imatges escalades per a la resolució 'size' i el seu manifest; retorna quantes"""
+    global use_preprocessed
+    init_display(size, fullscreen=False)
+    use_preprocessed = False
+    requests = collect_asset_requests()
+    out_dir = preprocessed_dir((WIDTH, HEIGHT))
+    os.makedirs(out_dir, exist_ok=True)
+    entries = {}
+    for path, img_size, flip, alpha in sorted(requests, key=str):
+        if img_size is None and not flip: continue
+        try: img = load_image(path, img_size, flip, alpha)
+        except (pygame.error, OSError): continue
+        name = asset_key_name(path, img_size, flip, alpha)
+        file_name = hashlib.sha1(name.encode("utf-8")).hexdigest()[:16] + ".rgba"
+        with open(os.path.join(out_dir, file_name), "wb") as f:
+            f.write(pygame.image.tobytes(img, "RGBA"))
+        st = os.stat(path)
+        entries[name] = {
+            "file": file_name, "size": list(img.get_size()),
+            "source_sha1": file_hash(path), "source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns,
+        }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": PREPROCESSED_VERSION, "resolution": [WIDTH, HEIGHT], "entries": entries}, f, indent=1)
+    use_preprocessed = True
+    return len(entries)
+
+# ==============================================================================
+# BENCHMARK (sense pantalla: python videojoc_nadal.py --bench)
+# ==============================================================================
+
+def bench_script_japan(frame, inp):
+    if frame % 45 == 0: inp.post_key(pygame.K_SPACE)
+
+def bench_script_tio(frame, inp):
+    if frame % 10 == 0: inp.post_key(pygame.K_SPACE)
+
+def bench_script_soup(frame, inp):
+    # Arrossega seleccions per files diferents del tauler
+    rows = soup_size[0]; cell, bx, by = soup_board_origin(*soup_size)
+    step = frame % 30; row = (frame // 30) % rows
+    if step == 0: inp.post_mouse(pygame.MOUSEBUTTONDOWN, (bx + cell // 2, by + row * cell + cell // 2))
+    elif step <= 10: inp.post_mouse(pygame.MOUSEMOTION, (bx + step * cell + cell // 2, by + row * cell + cell // 2))
+    elif step == 12: inp.post_mouse(pygame.MOUSEBUTTONUP, inp.mouse_pos)
+
+def bench_script_platformer(frame, inp):
+    inp.keys.pressed = {pygame.K_RIGHT}
+    if frame % 40 == 0: inp.post_key(pygame.K_SPACE)
+
+def bench_script_rhythm(frame, inp):
+    if frame % 31 == 0: inp.post_key(pygame.K_SPACE)
+
+BENCH_GAMES = {
+    "japan": (lambda: run_japan_game, bench_script_japan),
+    "tio": (lambda: run_tio_game, bench_script_tio),
+    "soup": (lambda: run_soup_game, bench_script_soup),
+    "platformer": (lambda: run_platformer_game, bench_script_platformer),
+    "rhythm": (lambda: run_rhythm_game, bench_script_rhythm),
+}
+
+def percentile(sorted_vals, p):
+    """Percentil pel mètode del rang més proper (llista ja ordenada)"""
+    if not sorted_vals: return 0.0
+    idx = max(0, min(len(sorted_vals) - 1, math.ceil(p / 100 * len(sorted_vals)) - 1))
+    return sorted_vals[idx]
+
+def bench_game(name, frames, character_name="marti", seed=1234):
+    """Executa un joc durant 'frames' frames amb entrada simulada i retorna els temps (ms)"""
+    global scripted_input, frame_hook
+    get_game, script = BENCH_GAMES[name]
+    times = []
+    last = [time.perf_counter()]
+
+    def hook():
+        now = time.perf_counter()
+        times.append((now - last[0]) * 1000)
+        last[0] = now
+        if len(times) == frames: scripted_input.post_key(pygame.K_ESCAPE)
+
+    random.seed(seed)
+    pygame.event.clear()
+    scripted_input = ScriptedInput(script); frame_hook = hook
+    try:
+        last[0] = time.perf_counter()
+        get_game()(character_name)
+    finally:
+        scripted_input = None; frame_hook = None
+        pygame.event.clear()
+    return times[:frames]
+
+def run_benchmark(games, frames, size):
+    global fps_cap, sim_frame_ms
+    init_display(size, fullscreen=False)
+    # Sense límit de frames, però un pas de simulació per frame perquè la càrrega sigui comparable
+    fps_cap = 0; sim_frame_ms = SIM_DT
+    print(f"Resolució {WIDTH}x{HEIGHT}, {frames} frames per joc")
+    print(f"{'joc':<12}{'frames':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in games:
+        times = sorted(bench_game(name, frames))
+        print(f"{name:<12}{len(times):>8}{percentile(times, 50):>10.2f}{percentile(times, 95):>10.2f}{percentile(times, 99):>10.2f}")
+    fps_cap = FPS; sim_frame_ms = None
+
+def parse_res(text):
+    """'1920x1080' -> (1920, 1080); per a type= d'argparse"""
+    w, h = (int(v) for v in text.lower().split("x"))
+    return w, h
+
+def parse_bench_args(argv):
+    global soup_size, level_file
+    parser = argparse.ArgumentParser(description="Benchmark sense pantalla dels minijocs")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--res", type=parse_res, default=(1920, 1080), help="resolució, p.ex. 3840x2160")
+    parser.add_argument("--games", default=",".join(BENCH_GAMES), help="llista separada per comes")
+    parser.add_argument("--dirty-rects", action="store_true", help="renderitzat per zones brutes")
+    parser.add_argument("--soup", type=parse_soup_size, default=None, help="sopa de lletres FILESxCOLUMNES:PARAULES, p.ex. 30x30:40")
+    parser.add_argument("--level", default=LEVEL_FILE, help="nivell del joc de plataformes (p.ex. nivell_grinch.txt)")
+    args = parser.parse_args(argv)
+    if args.soup: soup_size = args.soup
+    level_file = args.level
+    size = args.res
+    games = [g.strip() for g in args.games.split(",") if g.strip()]
+    for g in games:
+        if g not in BENCH_GAMES: parser.error(f"joc desconegut: {g}")
+    return games, args.frames, size
+
+# ==============================================================================
+# REPRODUCCIÓ DE PARTIDES GRAVADES (python videojoc_nadal.py --replay FITXER)
+# ==============================================================================
+
+def post_recorded_event(event):
+    ev_type = event[0]
+    if ev_type in (pygame.KEYDOWN, pygame.KEYUP):
+        pygame.event.post(pygame.event.Event(ev_type, key=event[1], mod=0, unicode=""))
+    elif ev_type == pygame.MOUSEMOTION:
+        pygame.event.post(pygame.event.Event(ev_type, pos=(event[1], event[2]), rel=(0, 0), buttons=(0, 0, 0)))
+    else:
+        pygame.event.post(pygame.event.Event(ev_type, pos=(event[1], event[2]), button=event[3]))
+
+# Jocs que pot nomenar un fitxer gravat (el fitxer no és de fiar: res més es pot cridar)
+REPLAY_GAMES = {game.__name__: game for game in (run_japan_game, run_tio_game, run_soup_game, run_platformer_game, run_rhythm_game)}
+
+def check_replay_session(i, session):
+    """Llença ValueError si la sessió nomena un joc o un personatge desconeguts"""
+    if session.get("game") not in REPLAY_GAMES:
+        raise ValueError(f"sessió {i}: joc desconegut {session.get('game')!r}")
+    if session.get("character") not in CHARACTERS:
+        raise ValueError(f"sessió {i}: personatge desconegut {session.get('character')!r}")
+
+def replay_session(session):
+    """
+    Torna a jugar una sessió gravada, frame a frame i sense límit de FPS.
+    Retorna (ms de cada frame, si el 'random' ha acabat igual que a la gravació).
+    """
+    global scripted_input, frame_hook, sim_frame_ms, song_time_override
+    frames = session["frames"]
+    times = []
+    last = [time.perf_counter()]
+
+    def apply(i, inp):
+        global sim_frame_ms, song_time_override
+        if i >= len(frames):
+            inp.post_key(pygame.K_ESCAPE); return  # la gravació s'ha tallat sense sortir del joc
+        frame_ms, events, keys, mouse = frames[i][:4]
+        sim_frame_ms = frame_ms
+        song_time_override = frames[i][4] if len(frames[i]) > 4 else None  # gravacions de la versió 1 no en tenen
+        if keys is not None: inp.keys.pressed = set(keys)
+        if mouse is not None: inp.mouse_pos = tuple(mouse)
+        for event in events: post_recorded_event(event)
+
+    def hook():
+        now = time.perf_counter()
+        times.append((now - last[0]) * 1000)
+        last[0] = now
+
+    random.seed(session["seed"])
+    pygame.event.clear()
+    scripted_input = ScriptedInput(lambda frame, inp: apply(frame + 1, inp)); frame_hook = hook
+    apply(0, scripted_input)
+    try:
+        last[0] = time.perf_counter()
+        REPLAY_GAMES[session["game"]](session["character"])
+    finally:
+        scripted_input = None; frame_hook = None; sim_frame_ms = None; song_time_override = None
+        pygame.event.clear()
+    return times, "rng_check" not in session or random.random() == session["rng_check"]
+
+def load_trace(path):
+    """Files d'una traça de --profile (.csv o .json) com a diccionaris"""
+    with open(path, encoding="utf-8", newline="") as f:
+        return json.load(f) if path.endswith(".json") else list(csv.DictReader(f))
+
+def trace_means(rows):
+    """Mitjana de cada columna numèrica de la traça, per escena"""
+    columns = FrameProfiler.COLUMNS[2:]
+    sums = {}
+    for row in rows:
+        acc = sums.setdefault(row["scene"], [0] * (len(columns) + 1))
+        for i, col in enumerate(columns): acc[i] += float(row[col])
+        acc[-1] += 1
+    return {scene: [v / acc[-1] for v in acc[:-1]] for scene, acc in sums.items()}
+
+def print_trace_diff(old_rows, new_rows):
+    old = trace_means(old_rows); new = trace_means(new_rows)
+    columns = FrameProfiler.COLUMNS[2:]
+    for scene in sorted(old.keys() & new.keys()):
+        print(scene)
+        for i, col in enumerate(columns):
+            print(f"  {col:<12}{old[scene][i]:>10.2f}{new[scene][i]:>10.2f}{new[scene][i] - old[scene][i]:>+10.2f}")
+
+def run_replay(path, session_index=None, trace_path=None, baseline=None):
+    global fps_cap
+    with open(path, encoding="utf-8") as f:
+        log = json.load(f)
+    try:
+        for i, session in enumerate(log["sessions"]): check_replay_session(i, session)
+    except ValueError as e:
+        sys.exit(f"{path}: {e}")
+    init_display(tuple(log["res"]), fullscreen=False)
+    fps_cap = 0
+    if trace_path or baseline: profiler.start_trace(trace_path)
+    print(f"Resolució {WIDTH}x{HEIGHT}")
+    print(f"{'#':<4}{'joc':<22}{'frames':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for i, session in enumerate(log["sessions"]):
+        if session_index is not None and i != session_index: continue
+        times, same = replay_session(session)
+        times.sort()
+        print(f"{i:<4}{session['game']:<22}{len(times):>8}{percentile(times, 50):>10.2f}{percentile(times, 95):>10.2f}"
+              f"{percentile(times, 99):>10.2f}  {'' if same else 'DIVERGEIX'}")
+    if baseline:
+        print(f"\nMitjanes per frame: {baseline} / aquesta execució / diferència")
+        print_trace_diff(load_trace(baseline), [dict(zip(FrameProfiler.COLUMNS, row)) for row in profiler.trace])
+    fps_cap = FPS
+
+def parse_replay_args(argv):
+    parser = argparse.ArgumentParser(description="Reprodueix partides gravades amb --record")
+    parser.add_argument("--replay", required=True, help="fitxer gravat amb --record")
+    parser.add_argument("--session", type=int, default=None, help="només aquesta sessió (per defecte totes)")
+    parser.add_argument("--profile", default=None, help="desa la traça de frames (.csv o .json)")
+    parser.add_argument("--baseline", default=None, help="traça d'una execució anterior per comparar-hi")
+    parser.add_argument("--dirty-rects", action="store_true", help="renderitzat per zones brutes")
+    args = parser.parse_args(argv)
+    return args.replay, args.session, args.profile, args.baseline
+
+def parse_preprocess_args(argv):
+    parser = argparse.ArgumentParser(description="Desa les imatges pre-escalades per a una resolució")
+    parser.add_argument("--preprocess", action="store_true")
+    parser.add_argument("--res", type=parse_res, default=(1920, 1080), help="resolució, p.ex. 3840x2160")
+    return parser.parse_args(argv).res
+
+def parse_game_args(argv):
+    parser = argparse.ArgumentParser(description="Joc de Nadal de família")
+    parser.add_argument("--fps", type=int, default=FPS, help="límit de FPS, p.ex. 120/144 Hz (0 = sense límit)")
+    parser.add_argument("--dirty-rects", action="store_true", help="renderitzat per zones brutes")
+    parser.add_argument("--soup", type=parse_soup_size, default=soup_size, help="sopa de lletres FILESxCOLUMNES:PARAULES, p.ex. 30x30:40")
+    parser.add_argument("--level", default=LEVEL_FILE, help="nivell del joc de plataformes (p.ex. nivell_grinch.txt)")
+    parser.add_argument("--profile", default=None, help="desa la traça de frames (.csv o .json)")
+    parser.add_argument("--record", default=None, help="grava les partides per reproduir-les amb --replay")
+    parser.add_argument("--startup-report", action="store_true", help="temps de cada fase de l'arrencada")
+    return parser.parse_args(argv)
 
 # --- EXECUCIÓ PRINCIPAL ---
+if __name__ == "__main__" and PREPROCESS_MODE:
+    count = preprocess_assets(parse_preprocess_args(sys.argv[1:]))
+    print(f"{count} imatges desades a {preprocessed_dir((WIDTH, HEIGHT))}")
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__" and BEATMAP_MODE:
+    print("Chart desat a", build_beat_chart(*parse_beatmap_args(sys.argv[1:])))
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__" and REPLAY_MODE:
+    dirty_rects_mode = "--dirty-rects" in sys.argv
+    run_replay(*parse_replay_args(sys.argv[1:]))
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__" and BENCH_MODE:
+    dirty_rects_mode = "--dirty-rects" in sys.argv
+    run_benchmark(*parse_bench_args(sys.argv[1:]))
+    pygame.quit()
+    sys.exit()
+
 if __name__ == "__main__":
+    args = parse_game_args(sys.argv[1:])
+    dirty_rects_mode = args.dirty_rects; fps_cap = args.fps
+    soup_size = args.soup; level_file = args.level
+    startup_times["import"] = (time.perf_counter() - STARTUP_T0) * 1000
+    init_display()
+    if args.profile: profiler.start_trace(args.profile)
+    if args.record: input_recorder = InputRecorder(args.record)
+    if args.startup_report:
+        def report_first_frame():
+            global frame_hook
+            frame_hook = None
+            print_startup_report()
+        frame_hook = report_first_frame
     while True:
         player_name = char_select_screen()
         if not player_name: break 